@@ -0,0 +1,65 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import history_store
+import result_cache
+import sweep
+
+# Optional USD-per-image prices, e.g. A4F_IMAGE_PRICES='{"provider-2/dall-e-3": 0.04}'
+PRICES_PER_IMAGE = json.loads(os.getenv("A4F_IMAGE_PRICES", "{}"))
+
+
+def estimate_cost(model, result):
+    """Cost reported by the API, else from PRICES_PER_IMAGE, else None."""
+    usage = result.get("usage") or {}
+    reported = result.get("cost", usage.get("cost"))
+    if reported is not None:
+        return float(reported)
+    if model in PRICES_PER_IMAGE:
+        return PRICES_PER_IMAGE[model] * len(result.get("data", []))
+    return None
+
+
+def compare_models(payload, models, generate=None, max_workers=8):
+    """Send one payload to several models concurrently.
+
+    Yields `(model, record, cached)` in completion order, where `record` is
+    `{"result", "latency", "cost", "error"}` (result is None on failure and
+    error says why). Successful records are stored in result_cache, so
+    repeated comparisons are free.
+
+    `generate(payload)` runs on worker threads, so it must not call any `st`
+    function; it may raise. It defaults to sweep.generate_image.
+    """
+    generate = generate or sweep.generate_image
+
+    def run(model):
+        model_payload = {**payload, "model": model}
+        record = result_cache.get(model_payload)
+        if record:
+            return model, record, True
+        start = time.perf_counter()
+        try:
+            result, error = generate(model_payload), None
+        except Exception as e:
+            result, error = None, str(e)
+        if not error and not (result and "data" in result):
+            error = "No images returned."
+        record = {
+            "result": result,
+            "latency": time.perf_counter() - start,
+            "cost": estimate_cost(model, result) if result else None,
+            "error": error,
+        }
+        if not error:
+            result_cache.put(model_payload, record)
+            # Off the critical path, so each row renders as soon as its model answers
+            history_store.record_images_async("generation", model_payload, result)
+        return model, record, False
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(models)) or 1) as pool:
+        futures = [pool.submit(run, m) for m in models]
+        for future in as_completed(futures):
+            yield future.result()
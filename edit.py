@@ -2,6 +2,7 @@ import os
 import streamlit as st
 import requests
 from dotenv import load_dotenv
+from preprocess import crop_to_content, prepare_edit_inputs
 
 # Load API key
 load_dotenv()
@@ -23,15 +24,24 @@ if st.button("✨ Edit Image"):
         st.warning("⚠️ Please upload an image and provide a prompt.")
         st.stop()
 
+    # Resize/recompress to the target size and validate the mask locally
+    try:
+        image_png, mask_png, box = prepare_edit_inputs(
+            img.getvalue(), mask.getvalue() if mask else None, size
+        )
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
+
     # Prepare payload
     files = {
-        "image": ("image.png", img, img.type),
+        "image": ("image.png", image_png, "image/png"),
         "prompt": (None, prompt),
         "size": (None, size),
         "model": (None, "provider-6/wan-2.1")
     }
-    if mask:
-        files["mask"] = ("mask.png", mask, mask.type)
+    if mask_png:
+        files["mask"] = ("mask.png", mask_png, "image/png")
 
     headers = {"Authorization": f"Bearer {API_KEY}"}
 
@@ -42,17 +52,14 @@ if st.button("✨ Edit Image"):
         data = resp.json()
         if data.get("data"):
             img_url = data["data"][0]["url"]
+            # The upload was letterboxed to the square size; crop the bars back off
+            img_bytes = crop_to_content(requests.get(img_url).content, box)
             st.success("✅ Image edited successfully!")
-            st.image(img_url, use_column_width=True)
+            st.image(img_bytes, use_column_width=True)
+            st.download_button("Download PNG", img_bytes, "edited.png", "image/png")
+            st.stop()
         else:
             st.error("❌ Unexpected response structure.")
     else:
         st.error(f"❌ API Error {resp.status_code}: {resp.text}")
-
-    # Download button
-    if data.get("data"):
-        img_url = data["data"][0]["url"]
-        img_bytes = requests.get(img_url).content
-        st.download_button("Download PNG", img_bytes, "edited.png", "image/png")
-        st.stop()
         1
\ No newline at end of file
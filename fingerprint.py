@@ -0,0 +1,115 @@
+"""Perceptual image fingerprints for near-duplicate detection.
+
+Each image gets three 64-bit hashes (aHash, dHash, pHash). Near-duplicate
+search uses pHash: hashes are kept in a packed uint64 NumPy array and the
+Hamming distance to every entry is one vectorised XOR + popcount.
+"""
+import io
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+# pHash bits that may differ for two images to count as near-duplicates
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("A4F_NEAR_DUP_BITS", 5))
+
+_DCT_SIZE = 32
+# Orthogonal DCT-II basis, so the 2-D transform is _DCT @ pixels @ _DCT.T
+_k, _n = np.meshgrid(np.arange(_DCT_SIZE), np.arange(_DCT_SIZE), indexing="ij")
+_DCT = np.cos(np.pi * (2 * _n + 1) * _k / (2 * _DCT_SIZE)) * np.sqrt(2 / _DCT_SIZE)
+_DCT[0] /= np.sqrt(2)
+
+
+def _gray(img, size):
+    return np.asarray(img.convert("L").resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def _pack(bits):
+    """64 booleans -> one unsigned 64-bit int."""
+    return int(np.packbits(bits.ravel().astype(np.uint8)).view(">u8")[0])
+
+
+def ahash(img):
+    px = _gray(img, (8, 8))
+    return _pack(px > px.mean())
+
+
+def dhash(img):
+    px = _gray(img, (9, 8))
+    return _pack(px[:, 1:] > px[:, :-1])
+
+
+def phash(img):
+    px = _gray(img, (_DCT_SIZE, _DCT_SIZE))
+    low = (_DCT @ px @ _DCT.T)[:8, :8]
+    # Median without the DC term, which only reflects overall brightness
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+def fingerprints(data):
+    """{"ahash", "dhash", "phash"} for image bytes, or None if unreadable."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            return {"ahash": ahash(img), "dhash": dhash(img), "phash": phash(img)}
+    except Exception:
+        return None
+
+
+# SQLite INTEGER is signed 64-bit
+def to_signed(h):
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def to_unsigned(h):
+    return h & 0xFFFFFFFFFFFFFFFF
+
+
+def hamming(hashes, h):
+    """Hamming distance from `h` to every entry of a uint64 array."""
+    return np.bitwise_count(np.asarray(hashes, dtype=np.uint64) ^ np.uint64(h))
+
+
+def collapse(hashes, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """Group labels: entry i gets the index of the first near-duplicate before it."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    labels = np.full(len(hashes), -1, dtype=np.int64)
+    for i in range(len(hashes)):
+        if labels[i] < 0:
+            close = (hamming(hashes, hashes[i]) <= max_distance) & (labels < 0)
+            labels[close] = i
+    return labels
+
+
+# --- Index ---
+class FingerprintIndex:
+    """Append-only (id, pHash) index over a growable packed uint64 array."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = np.empty(1024, dtype=np.int64)
+        self._hashes = np.empty(1024, dtype=np.uint64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, id_, h):
+        with self._lock:
+            if self._size == len(self._hashes):
+                # Double capacity so appends stay amortised O(1)
+                self._ids = np.resize(self._ids, 2 * self._size)
+                self._hashes = np.resize(self._hashes, 2 * self._size)
+            self._ids[self._size] = id_
+            self._hashes[self._size] = np.uint64(to_unsigned(h))
+            self._size += 1
+
+    def nearest(self, h, max_distance=NEAR_DUPLICATE_DISTANCE):
+        """[(id, distance)] of entries within `max_distance`, closest first."""
+        with self._lock:
+            dist = hamming(self._hashes[:self._size], to_unsigned(h))
+            ids = self._ids[:self._size]
+        hits = np.flatnonzero(dist <= max_distance)
+        hits = hits[np.argsort(dist[hits], kind="stable")]
+        return [(int(ids[i]), int(dist[i])) for i in hits]
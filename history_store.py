@@ -0,0 +1,340 @@
+"""Persistent history of generations, edits, transcriptions and chat turns.
+
+Events live in SQLite (WAL mode, so several Streamlit workers can read while
+one writes) with an FTS5 index over the prompt text. Binary artifacts are
+stored content-addressed under `data/artifacts/` and referenced by path.
+
+Ops queries: python history_store.py --model provider-4/imagen-4 --since 2026-10-11
+"""
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import requests
+
+from fingerprint import FingerprintIndex, fingerprints, to_signed
+from shared_state import DATA_DIR
+
+log = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(DATA_DIR, "history.db")
+ARTIFACT_DIR = os.path.join(DATA_DIR, "artifacts")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id       INTEGER PRIMARY KEY,
+    ts       REAL NOT NULL,
+    kind     TEXT NOT NULL,   -- generation | edit | transcription | chat
+    model    TEXT,
+    prompt   TEXT,
+    params   TEXT,            -- JSON
+    artifact TEXT,            -- path relative to DATA_DIR
+    session  TEXT,
+    ahash    INTEGER,         -- perceptual hashes (signed 64-bit), images only
+    dhash    INTEGER,
+    phash    INTEGER,
+    duplicate_of INTEGER      -- id of the near-identical image this one repeats
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_kind_ts ON events(kind, ts);
+CREATE INDEX IF NOT EXISTS events_model_ts ON events(model, ts);
+CREATE INDEX IF NOT EXISTS events_session_ts ON events(session, ts);
+CREATE INDEX IF NOT EXISTS events_prompt ON events(prompt);
+CREATE INDEX IF NOT EXISTS events_duplicate_of ON events(duplicate_of);
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+    prompt, content='events', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS events_ai AFTER INSERT ON events BEGIN
+    INSERT INTO events_fts(rowid, prompt) VALUES (new.id, new.prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS events_ad AFTER DELETE ON events BEGIN
+    INSERT INTO events_fts(events_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+END;
+"""
+
+# Columns added after the first release; older databases get them on connect
+MIGRATIONS = {
+    "ahash": "INTEGER", "dhash": "INTEGER", "phash": "INTEGER", "duplicate_of": "INTEGER",
+}
+
+# Small pool of connections shared by all threads. Streamlit runs every
+# rerun in a new thread, so per-thread connections would reconnect each time.
+POOL_SIZE = 4
+_pool = queue.LifoQueue()
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+# pHashes of original (non-duplicate) images, refreshed incrementally by id
+_index = FingerprintIndex()
+_index_last_id = 0
+_index_lock = threading.RLock()
+
+
+def _open():
+    global _schema_ready
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _schema_lock:
+        if not _schema_ready:
+            # journal_mode is stored in the database file, so once is enough
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+            for column, kind in MIGRATIONS.items():
+                if columns and column not in columns:
+                    conn.execute(f"ALTER TABLE events ADD COLUMN {column} {kind}")
+            conn.executescript(SCHEMA)
+            _schema_ready = True
+    return conn
+
+
+@contextmanager
+def connect():
+    """Borrow a pooled connection for the duration of the block."""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open()
+    try:
+        yield conn
+    finally:
+        if _pool.qsize() < POOL_SIZE:
+            _pool.put(conn)
+        else:
+            conn.close()
+
+
+# --- Artifacts ---
+def save_artifact(data, ext):
+    """Store bytes content-addressed; return the path relative to DATA_DIR."""
+    digest = hashlib.sha256(data).hexdigest()
+    rel = os.path.join("artifacts", digest[:2], f"{digest}.{ext}")
+    path = os.path.join(DATA_DIR, rel)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+    return rel
+
+
+def artifact_path(rel):
+    return os.path.join(DATA_DIR, rel)
+
+
+def fetch_image(data):
+    """Bytes of one `data` entry of an image response (url or b64_json)."""
+    if "b64_json" in data:
+        return base64.b64decode(data["b64_json"])
+    r = requests.get(data["url"], timeout=60)
+    r.raise_for_status()
+    return r.content
+
+
+# --- Writing ---
+def _insert(kind, model, prompt, params, rel, session, hashes=None, duplicate_of=None):
+    hashes = {k: to_signed(v) for k, v in (hashes or {}).items()}
+    with connect() as conn, conn:
+        cur = conn.execute(
+            "INSERT INTO events (ts, kind, model, prompt, params, artifact, session, ahash, dhash, phash, duplicate_of)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), kind, model, prompt, json.dumps(params or {}), rel, session,
+             hashes.get("ahash"), hashes.get("dhash"), hashes.get("phash"), duplicate_of),
+        )
+    return cur.lastrowid
+
+
+def record(kind, model=None, prompt=None, params=None, artifact=None, ext="png", session=None):
+    """Insert one event; `artifact` is optional bytes saved to disk. Returns the id."""
+    rel = save_artifact(artifact, ext) if artifact else None
+    return _insert(kind, model, prompt, params, rel, session)
+
+
+def _refresh_index():
+    # Pick up images recorded since the last refresh, by any process
+    global _index_last_id
+    with connect() as conn:
+        rows = conn.execute(
+            "SELECT id, phash FROM events WHERE id > ? AND phash IS NOT NULL AND duplicate_of IS NULL ORDER BY id",
+            (_index_last_id,),
+        ).fetchall()
+    for row in rows:
+        _index.add(row["id"], row["phash"])
+        _index_last_id = row["id"]
+
+
+def find_near_duplicate(phash):
+    """(id, artifact) of the closest stored original within the pHash threshold, or None."""
+    with _index_lock:
+        _refresh_index()
+        hits = _index.nearest(phash)
+    if not hits:
+        return None
+    with connect() as conn:
+        row = conn.execute("SELECT id, artifact FROM events WHERE id = ?", (hits[0][0],)).fetchone()
+    return (row["id"], row["artifact"]) if row else None
+
+
+def record_image(kind, model, prompt, params, blob, session=None):
+    """Record an image event with its fingerprints.
+
+    A near-duplicate of an earlier image keeps its own artifact file but is
+    marked with `duplicate_of`, so history views can collapse it under the
+    original.
+    """
+    rel = save_artifact(blob, "png") if blob else None
+    hashes = fingerprints(blob) if blob else None
+    if not hashes:
+        return _insert(kind, model, prompt, params, rel, session)
+    # Held across lookup and insert so concurrent workers can't both record an original
+    with _index_lock:
+        original = find_near_duplicate(hashes["phash"])
+        return _insert(kind, model, prompt, params, rel, session, hashes, original and original[0])
+
+
+def record_images(kind, payload, result, images=None, session=None):
+    """Record one event per image in an image API `result`.
+
+    `images` may supply already-downloaded bytes (same order as result["data"])
+    so callers that fetched them for a download button don't fetch twice.
+    """
+    params = {k: v for k, v in payload.items() if k not in ("model", "prompt")}
+    for idx, data in enumerate(result.get("data", [])):
+        blob = images[idx] if images and idx < len(images) else None
+        if blob is None:
+            try:
+                blob = fetch_image(data)
+            except Exception:
+                blob = None
+        record_image(
+            kind, payload.get("model"), payload.get("prompt"),
+            {**params, "url": data.get("url"), "index": idx}, blob, session=session,
+        )
+
+
+# Recording re-downloads and fingerprints every image, so UI callers hand it
+# to this pool instead of holding up their rerun
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history")
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        log.error("Recording history failed", exc_info=future.exception())
+
+
+def record_images_async(kind, payload, result, images=None, session=None):
+    """record_images() on a background thread; failures are logged."""
+    future = _background.submit(record_images, kind, payload, result, images, session)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+# --- Reading ---
+def _fts_query(text):
+    # Quote each word so user input can't break FTS5 query syntax
+    return " ".join('"' + w.replace('"', '""') + '"' for w in text.split())
+
+
+def _where(kind=None, model=None, since=None, until=None, text=None, session=None, originals_only=False):
+    clauses, args = [], []
+    for column, value in (("kind", kind), ("model", model), ("session", session)):
+        if value:
+            clauses.append(f"{column} = ?")
+            args.append(value)
+    if since:
+        clauses.append("ts >= ?")
+        args.append(since)
+    if until:
+        clauses.append("ts < ?")
+        args.append(until)
+    if text and text.strip():
+        clauses.append("id IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?)")
+        args.append(_fts_query(text))
+    if originals_only:
+        # Hide a near-duplicate only when its original passes the same filters
+        # (and is listed itself); otherwise it stands in for the original
+        same = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        clauses.append(f"(duplicate_of IS NULL OR duplicate_of NOT IN (SELECT id FROM events{same}))")
+        args.extend(list(args))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+
+def query(limit=20, offset=0, oldest_first=False, **filters):
+    """Events matching `filters` (kind, model, since, until, text, session,
+    originals_only), newest first."""
+    where, args = _where(**filters)
+    order = "ASC" if oldest_first else "DESC"
+    with connect() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM events{where} ORDER BY ts {order}, id {order} LIMIT ? OFFSET ?",
+            (*args, limit, offset),
+        ).fetchall()
+    return [{**dict(r), "params": json.loads(r["params"] or "{}")} for r in rows]
+
+
+def count(**filters):
+    where, args = _where(**filters)
+    with connect() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM events{where}", args).fetchone()[0]
+
+
+def duplicate_counts(ids, **filters):
+    """{original id: number of near-duplicates recorded after it that match
+    `filters` (the ones an originals_only query folded into it)}."""
+    if not ids:
+        return {}
+    filters.pop("originals_only", None)
+    where, args = _where(**filters)
+    marks = ",".join("?" * len(ids))
+    where = (where + " AND " if where else " WHERE ") + f"duplicate_of IN ({marks})"
+    with connect() as conn:
+        rows = conn.execute(
+            f"SELECT duplicate_of, COUNT(*) FROM events{where} GROUP BY duplicate_of",
+            [*args, *ids],
+        ).fetchall()
+    return dict(rows)
+
+
+def models(kind=None, session=None):
+    where, args = _where(kind=kind, session=session)
+    with connect() as conn:
+        rows = conn.execute(f"SELECT DISTINCT model FROM events{where} ORDER BY model", args).fetchall()
+    return [r[0] for r in rows if r[0]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the generation history.")
+    parser.add_argument("--kind", choices=["generation", "edit", "transcription", "chat"])
+    parser.add_argument("--model")
+    parser.add_argument("--text", help="full-text search over prompts")
+    parser.add_argument("--since", help="YYYY-MM-DD")
+    parser.add_argument("--until", help="YYYY-MM-DD (exclusive)")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    def ts(day):
+        return datetime.strptime(day, "%Y-%m-%d").timestamp() if day else None
+
+    filters = dict(kind=args.kind, model=args.model, text=args.text, since=ts(args.since), until=ts(args.until))
+    started = time.perf_counter()
+    rows = query(limit=args.limit, **filters)
+    total = count(**filters)
+    for row in rows:
+        when = datetime.fromtimestamp(row["ts"]).strftime("%Y-%m-%d %H:%M")
+        print(f"{when}  {row['kind']:<13} {row['model'] or '-':<40} {(row['prompt'] or '')[:60]}")
+    print(f"{len(rows)} of {total} events ({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
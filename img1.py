@@ -1,8 +1,19 @@
+import json
 import os
 import time
+import uuid
+from datetime import date, timedelta
 import requests
 import streamlit as st
 from dotenv import load_dotenv
+import history_store
+from compare import compare_models
+from sweep import SWEEP_DIR, job_status, run_sweep
+from usage_cache import load_usage, raw_usage
+from preprocess import crop_to_content, prepare_edit_inputs
+from shared_state import rate_limit, throttle
+from singleflight import single_flight
+from video_store import fetch_video, stored_videos
 
 # --- Load API Key ---
 load_dotenv()
@@ -24,6 +35,9 @@ MULTIPART_HEADERS = {"Authorization": f"Bearer {API_KEY}"}
 def make_request(method, url, headers, **kwargs):
     """A robust function to handle API requests and errors."""
     try:
+        # Shared per-provider rate limit across all replicas
+        body = kwargs.get("json") or kwargs.get("data") or {}
+        throttle(body.get("model"))
         response = requests.request(method, url, headers=headers, **kwargs)
         response.raise_for_status()
         # Handle different content types in response
@@ -40,6 +54,9 @@ def make_request(method, url, headers, **kwargs):
         return None
 
 # --- Helper: Prompt Enhancer ---
+# Identical prompts (e.g. presets) from concurrent sessions share one request.
+# Nothing is retained (ttl=0): clicking Enhance again should give a new take.
+@single_flight(ttl=0, on_shared_failure=lambda: st.error("Prompt enhancement failed. Please try again."))
 def enhance_prompt(user_prompt):
     url = "https://api.a4f.co/v1/chat/completions"
     payload = {
@@ -121,61 +138,125 @@ def generate_video(payload):
     return make_request("post", url, headers=JSON_HEADERS, json=payload)
 
 # --- Helper: List Models ---
+@single_flight(ttl=60, on_shared_failure=lambda: st.error("Could not list models. Please try again."))
 def list_models():
     url = "https://api.a4f.co/v1/models"
     return make_request("get", url, headers=JSON_HEADERS)
 
 # --- Helper: Get Usage ---
+@single_flight(ttl=30)
 def get_usage(start_date, end_date):
+    # Runs on usage_cache's worker threads (no script context), so failures
+    # are raised for the Usage tab to show instead of drawn with st.error.
+    # GETs carry no model, so usage calls share their own rate-limit bucket.
+    rate_limit("usage")
     url = f"https://api.a4f.co/v1/usage?start_date={start_date}&end_date={end_date}"
-    return make_request("get", url, headers=JSON_HEADERS)
-
+    response = requests.get(url, headers=JSON_HEADERS, timeout=60)
+    if not response.ok:
+        raise RuntimeError(f"HTTP {response.status_code} for {start_date}..{end_date}: {response.text[:300]}")
+    return response.json()
+
+
+# Chat turns reloaded from the history store when a conversation is restored
+CHAT_HISTORY_LIMIT = 200
+
+# --- Memoized per-tab state ---
+# The whole script re-executes on every full rerun (and for every new
+# session), so anything read from disk or the database goes through st.cache_*.
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)
+def restore_chat(chat_id):
+    """Messages of a stored conversation, oldest first.
+
+    Cleared here on every new turn; the TTL bounds staleness for turns
+    recorded by other replicas.
+    """
+    turns = history_store.query(kind="chat", session=chat_id, limit=CHAT_HISTORY_LIMIT)
+    return [{"role": t["params"]["role"], "content": t["prompt"]} for t in reversed(turns)]
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def list_stored_videos():
+    # Other replicas add and evict videos too, hence the short TTL
+    return stored_videos()
+
+
+# --- Helper: Comparison Grid Row ---
+def render_comparison_row(model, record, fmt, cached):
+    """One row of the model-by-image comparison grid."""
+    cost = f"${record['cost']:.4f}" if record.get("cost") is not None else "cost n/a"
+    source = "cached" if cached else "live"
+    st.markdown(f"**{model}** · {record['latency']:.1f}s · {cost} · {source}")
+    result = record.get("result")
+    if record.get("error") or not result or "data" not in result:
+        st.error(f"{model} failed to generate images: {record.get('error') or 'no images returned'}")
+        return
+    cols = st.columns(len(result["data"]))
+    for idx, data in enumerate(result["data"]):
+        with cols[idx]:
+            st.image(data["url"] if fmt == "url" else data["b64_json"], caption=f"Image {idx+1}", use_container_width=True)
+
+
+# --- Model Lists ---
+# Plain constants: cheap to rebuild on each full rerun (fragment reruns skip
+# them); state loaded from disk or the API is memoized above instead
+CHAT_MODELS = [
+    "provider-2/gpt-3.5-turbo",
+    "provider-1/gemma-3-12b-it",
+    "provider-1/gemma-2-27b-it",
+    "provider-1/gemini-2.0-flash-lite-001",
+    "provider-2/gemini-2.0-flash",
+    "provider-6/gemini-2.5-flash",
+    "provider-6/gemini-2.5-flash-thinking",
+    "provider-3/gpt-4o-mini",
+    "provider-3/gpt-4",
+    "provider-6/gpt-4.1-mini",
+    "provider-6/gpt-4.1-nano",
+    "provider-6/gpt-4o-mini-search-preview",
+    "provider-6/gpt-4o",
+    "provider-6/o3-high",
+    "provider-6/gpt-4.1",
+    "provider-1/llama-3.3-70b-instruct-turbo",
+    "provider-2/codestral",
+    "provider-1/llama-4-maverick-17b-128e",
+    "provider-2/llama-4-maverick",
+    "provider-2/llama-4-scout",
+    "provider-3/llama-3.2-3b",
+    "provider-3/llama-3.3-70b",
+    "provider-2/qwq-32b",
+    "provider-3/qwen-3-235b-a22b-2507",
+    "provider-3/deepseek-v3",
+    "provider-3/deepseek-v3-0324",
+    "provider-6/kimi-k2",
+    "provider-3/qwen-3-235b-a22b",
+    "provider-6/minimax-m1-40k",
+]
+
+MODELS = [
+    "provider-4/imagen-3", "provider-4/imagen-4", "provider-1/FLUX.1-schnell",
+    "provider-2/FLUX.1-schnell", "provider-3/imagen-3.0-generate-002",
+    "provider-3/imagen-4.0-generate-preview-06-06", "provider-6/sana-1.5-flash",
+    "provider-2/dall-e-3", "provider-6/sana-1.5", "provider-3/FLUX.1-dev",
+    "provider-6/FLUX.1.1-pro", "provider-1/FLUX.1.1-pro", "provider-6/FLUX.1-kontext-dev",
+    "provider-1/FLUX.1-kontext-pro", "provider-6/FLUX.1-kontext-max",
+    "provider-2/FLUX.1-schnell-v2"
+]
+
+# Every tab is a fragment: a widget interaction reruns only its own tab
+# function, not all nine tabs (and not the full chat history re-render).
 
-# --- UI: Title & Tabs ---
-st.title("A4F API Suite")
-tab0, tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
-    "💬 Chat", "🖼️ Image Generation", "🎨 Image Edits", "🔡 Embeddings", "🗣️ Text-to-Speech",
-    "🎤 Speech-to-Text", "🎬 Video Generation", "📦 List Models", "📊 Get Usage"
-])
 # --- UI: Chat Tab ---
-with tab0:
+@st.fragment
+def chat_tab():
     st.header("💬 Chat Completion")
-    chat_model = st.selectbox("Choose a chat model", [
-        "provider-2/gpt-3.5-turbo",
-        "provider-1/gemma-3-12b-it",
-        "provider-1/gemma-2-27b-it",
-        "provider-1/gemini-2.0-flash-lite-001",
-        "provider-2/gemini-2.0-flash",
-        "provider-6/gemini-2.5-flash",
-        "provider-6/gemini-2.5-flash-thinking",
-        "provider-3/gpt-4o-mini",
-        "provider-3/gpt-4",
-        "provider-6/gpt-4.1-mini",
-        "provider-6/gpt-4.1-nano",
-        "provider-6/gpt-4o-mini-search-preview",
-        "provider-6/gpt-4o",
-        "provider-6/o3-high",
-        "provider-6/gpt-4.1",
-        "provider-1/llama-3.3-70b-instruct-turbo",
-        "provider-2/codestral",
-        "provider-1/llama-4-maverick-17b-128e",
-        "provider-2/llama-4-maverick",
-        "provider-2/llama-4-scout",
-        "provider-3/llama-3.2-3b",
-        "provider-3/llama-3.3-70b",
-        "provider-2/qwq-32b",
-        "provider-3/qwen-3-235b-a22b-2507",
-        "provider-3/deepseek-v3",
-        "provider-3/deepseek-v3-0324",
-        "provider-6/kimi-k2",
-        "provider-3/qwen-3-235b-a22b",
-        "provider-6/minimax-m1-40k"
-
-    ], key="chat_model")
+    chat_model = st.selectbox("Choose a chat model", CHAT_MODELS, key="chat_model")
     
-    # Initialize chat history
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    # Conversation id lives in the URL, so a refresh (or a shared link) restores the chat
+    if "chat" not in st.query_params:
+        st.query_params["chat"] = uuid.uuid4().hex[:12]
+    chat_id = st.query_params["chat"]
+    if st.session_state.get("chat_id") != chat_id:
+        st.session_state.chat_id = chat_id
+        st.session_state.messages = restore_chat(chat_id)
 
     # Display chat messages from history
     for message in st.session_state.messages:
@@ -186,6 +267,8 @@ with tab0:
     if prompt := st.chat_input("What is up?"):
         # Add user message to history
         st.session_state.messages.append({"role": "user", "content": prompt})
+        history_store.record("chat", chat_model, prompt, {"role": "user"}, session=chat_id)
+        restore_chat.clear(chat_id)
         with st.chat_message("user"):
             st.markdown(prompt)
 
@@ -197,19 +280,14 @@ with tab0:
         
         # Add assistant response to history
         st.session_state.messages.append({"role": "assistant", "content": response})
+        history_store.record("chat", chat_model, response, {"role": "assistant"}, session=chat_id)
+        restore_chat.clear(chat_id)
+
 
 # --- UI: Image Generation Tab ---
-with tab1:
+@st.fragment
+def image_generation_tab():
     st.header("🖼️ Image Generation")
-    MODELS = [
-        "provider-4/imagen-3", "provider-4/imagen-4", "provider-1/FLUX.1-schnell",
-        "provider-2/FLUX.1-schnell", "provider-3/imagen-3.0-generate-002",
-        "provider-3/imagen-4.0-generate-preview-06-06", "provider-6/sana-1.5-flash",
-        "provider-2/dall-e-3", "provider-6/sana-1.5", "provider-3/FLUX.1-dev",
-        "provider-6/FLUX.1.1-pro", "provider-1/FLUX.1.1-pro", "provider-6/FLUX.1-kontext-dev",
-        "provider-1/FLUX.1-kontext-pro", "provider-6/FLUX.1-kontext-max",
-        "provider-2/FLUX.1-schnell-v2"
-    ]
     model = st.selectbox("Choose image model", MODELS, key="ig_model")
     prompt = st.text_input("Enter image prompt", key="ig_prompt")
     size = st.selectbox("Size", ["256x256", "512x512", "1024x1024"], key="ig_size")
@@ -242,6 +320,7 @@ with tab1:
                     result = generate_image(payload)
                     if result and "data" in result:
                         cols = st.columns(min(n, len(result["data"])))
+                        images = []
                         for idx, data in enumerate(result["data"]):
                             with cols[idx % len(cols)]:
                                 if fmt == "url":
@@ -249,14 +328,91 @@ with tab1:
                                     st.image(img_url, caption=f"Image {idx+1}", use_container_width=True)
                                     try:
                                         img_bytes = requests.get(img_url).content
+                                        images.append(img_bytes)
                                         st.download_button("Download PNG", img_bytes, f"image_{idx+1}.png", "image/png", key=f"dl_{idx}")
                                     except Exception as e:
                                         st.error(f"Could not download image {idx+1}")
                                 else:
                                     st.image(data["b64_json"], caption=f"Image {idx+1}", use_container_width=True)
+                        # Reuse the downloaded bytes when they are all there
+                        history_store.record_images_async("generation", payload, result, images if len(images) == len(result["data"]) else None)
+
+    # --- Compare one prompt across several models concurrently ---
+    st.divider()
+    compare_selection = st.multiselect("🔀 Compare models", MODELS, default=MODELS[:4], key="ig_compare_models")
+    if st.button("🔀 Compare Models"):
+        if not prompt.strip():
+            st.error("❗ Prompt cannot be empty.")
+        elif not compare_selection:
+            st.warning("Please choose at least one model to compare.")
+        else:
+            payload = {"prompt": prompt, "n": n, "size": size, "quality": quality, "response_format": fmt}
+            st.session_state.ig_compare = {"fmt": fmt, "rows": {}}
+            slots = {m: st.empty() for m in compare_selection}
+            for m in compare_selection:
+                slots[m].info(f"⏳ {m}: waiting...")
+            with st.spinner(f"Comparing {len(compare_selection)} models..."):
+                # Workers use an st-free HTTP helper; failures come back in
+                # `record` and are drawn here, on the script thread
+                for m, record, cached in compare_models(payload, compare_selection):
+                    st.session_state.ig_compare["rows"][m] = {"record": record, "cached": cached}
+                    with slots[m].container():
+                        render_comparison_row(m, record, fmt, cached)
+    elif "ig_compare" in st.session_state:
+        # Reruns redraw the last comparison from session state, no new requests
+        for m, row in st.session_state.ig_compare["rows"].items():
+            render_comparison_row(m, row["record"], st.session_state.ig_compare["fmt"], row["cached"])
+
+    # --- Prompt × parameter sweep (same engine as `python sweep.py spec.json`) ---
+    with st.expander("🧪 Parameter Sweep"):
+        sweep_name = st.text_input("Sweep name", "sweep", key="sw_name")
+        sweep_prompts = st.text_area("Prompt variants (one per line)", key="sw_prompts")
+        sweep_models = st.multiselect("Models", MODELS, default=MODELS[:2], key="sw_models")
+        sweep_sizes = st.multiselect("Sizes", ["256x256", "512x512", "1024x1024"], default=["512x512"], key="sw_sizes")
+        sweep_qualities = st.multiselect("Qualities", ["standard", "hd"], default=["standard"], key="sw_qualities")
+        sweep_n = st.slider("Images per cell", 1, 4, 1, key="sw_n")
+        # Job metadata is shared, so this shows sweeps started on other replicas too
+        status = job_status(os.path.join(SWEEP_DIR, sweep_name.strip() or "sweep"))
+        if status:
+            st.caption(f"Last run: {status['status']} · {status['finished']}/{status['total']} cells · {status['host']}")
+
+        if st.button("🧪 Run Sweep"):
+            prompts = [p.strip() for p in sweep_prompts.splitlines() if p.strip()]
+            if not all([prompts, sweep_models, sweep_sizes, sweep_qualities]):
+                st.warning("Please provide prompts, models, sizes and qualities.")
+            else:
+                spec = {
+                    "name": sweep_name.strip() or "sweep", "prompts": prompts, "models": sweep_models,
+                    "sizes": sweep_sizes, "qualities": sweep_qualities, "n": sweep_n,
+                }
+                bar = st.progress(0.0, text="Starting sweep...")
+                try:
+                    manifest = run_sweep(
+                        spec,
+                        progress=lambda cell, done, total: bar.progress(done / total, text=f"{done}/{total} cells"),
+                        lock_timeout=5,
+                    )
+                except TimeoutError:
+                    bar.empty()
+                    busy = job_status(os.path.join(SWEEP_DIR, spec["name"])) or {}
+                    st.warning(
+                        f"Sweep '{spec['name']}' is already running on {busy.get('host', 'another replica')}"
+                        f" ({busy.get('finished', '?')}/{busy.get('total', '?')} cells). Try again when it finishes."
+                    )
+                    return
+                bar.progress(1.0, text="Sweep complete")
+                failed = [c for c in manifest["cells"] if c["status"] != "ok"]
+                if failed:
+                    st.warning(f"{len(failed)} cells failed; run the sweep again to retry them.")
+                out_dir = os.path.join(SWEEP_DIR, spec["name"])
+                if manifest["contact_sheet"]:
+                    st.image(os.path.join(out_dir, manifest["contact_sheet"]), caption="Contact sheet", use_container_width=True)
+                st.download_button("Download manifest", json.dumps(manifest, indent=2), "manifest.json", "application/json")
+
 
 # --- UI: Image Edits Tab ---
-with tab2:
+@st.fragment
+def image_edits_tab():
     st.header("🎨 Image Edits")
     edit_model = st.selectbox("Choose edit model", ["provider-6/black-forest-labs-flux-1-kontext-dev","provider-6/black-forest-labs-flux-1-kontext-pro","provider-6/black-forest-labs-flux-1-kontext-max"], key="ie_model")
     edit_prompt = st.text_area("What to change in the image?", key="ie_prompt")
@@ -275,17 +431,41 @@ with tab2:
                 "n": str(edit_n),
                 "size": edit_size
             }
+            # Resize/recompress locally and validate the mask before uploading
+            try:
+                image_png, mask_png, box = prepare_edit_inputs(
+                    image_file.getvalue(), mask_file.getvalue() if mask_file else None, edit_size
+                )
+            except ValueError as e:
+                st.error(f"❗ {e}")
+                return
             with st.spinner("Editing image..."):
-                result = edit_image(payload, image_file, mask_file)
+                result = edit_image(
+                    payload,
+                    ("image.png", image_png, "image/png"),
+                    ("mask.png", mask_png, "image/png") if mask_png else None,
+                )
                 if result and "data" in result:
                     st.success("Edit complete!")
                     cols = st.columns(min(edit_n, len(result["data"])))
+                    images = []
                     for i, img_data in enumerate(result["data"]):
                         with cols[i]:
-                            st.image(img_data["url"], caption=f"Edited Image {i+1}", use_container_width=True)
+                            # Uploads are letterboxed to the square size; crop the bars back off
+                            try:
+                                edited = crop_to_content(history_store.fetch_image(img_data), box)
+                            except Exception:
+                                st.image(img_data["url"], caption=f"Edited Image {i+1} (letterboxed)", use_container_width=True)
+                                continue
+                            images.append(edited)
+                            st.image(edited, caption=f"Edited Image {i+1}", use_container_width=True)
+                            st.download_button("Download PNG", edited, f"edited_{i+1}.png", "image/png", key=f"ie_dl_{i}")
+                    history_store.record_images_async("edit", payload, result, images if len(images) == len(result["data"]) else None)
+
 
 # --- UI: Embeddings Tab ---
-with tab3:
+@st.fragment
+def embeddings_tab():
     st.header("🔡 Embeddings")
     embed_model = st.selectbox("Choose embedding model", ["provider-2/text-embedding-3-small","provider-3/text-embedding-ada-002"], key="em_model")
     embed_input = st.text_area("Text to embed", key="em_input")
@@ -301,8 +481,10 @@ with tab3:
         else:
             st.warning("Please enter text to embed.")
 
+
 # --- UI: Text-to-Speech Tab ---
-with tab4:
+@st.fragment
+def tts_tab():
     st.header("🗣️ Text-to-Speech")
     tts_model = st.selectbox("Choose TTS model", ["provider-3/tts-1", "provider-2/tts-1-hd", "provider-6/sonic-2", "provider-6/sonic"], key="tts_model")
     tts_input = st.text_area("Text to convert to speech", key="tts_input")
@@ -320,8 +502,10 @@ with tab4:
         else:
             st.warning("Please enter text for speech synthesis.")
 
+
 # --- UI: Speech-to-Text Tab ---
-with tab5:
+@st.fragment
+def stt_tab():
     st.header("🎤 Speech-to-Text")
     stt_model = st.selectbox("Choose STT model", ["provider-2/whisper-1", "provider-6/distil-whisper-large-v3-en", "provider-3/gpt-4o-mini-transcribe"], key="stt_model")
     audio_file = st.file_uploader("Upload an audio file", type=["mp3", "wav", "m4a"], key="stt_file")
@@ -334,11 +518,17 @@ with tab5:
                 if result and "text" in result:
                     st.success("Transcription complete!")
                     st.text_area("Transcription", result["text"], height=150)
+                    history_store.record(
+                        "transcription", stt_model, result["text"], {"filename": audio_file.name},
+                        audio_file.getvalue(), ext=audio_file.name.rsplit(".", 1)[-1],
+                    )
         else:
             st.warning("Please upload an audio file.")
 
+
 # --- UI: Video Generation Tab ---
-with tab6:
+@st.fragment
+def video_tab():
     st.header("🎬 Video Generation")
     video_model = st.selectbox("Choose video model", ["provider-6/wan-2.1"], key="vg_model")
     video_prompt = st.text_area("Video prompt", key="vg_prompt")
@@ -354,10 +544,50 @@ with tab6:
                 if result and "data" in result:
                     st.success("Video Generated!")
                     video_url = result["data"][0]["url"]
-                    st.video(video_url)
+                    # Play/download from the shared local copy instead of the provider URL
+                    try:
+                        video_path = fetch_video(video_url, {"prompt": video_prompt, "model": video_model})
+                        list_stored_videos.clear()
+                    except Exception as e:
+                        st.warning(f"Could not store the video locally ({e}); streaming from the provider.")
+                        video_path = None
+                    # Kept in session_state so later reruns (e.g. the download click) still show it
+                    st.session_state["vg_video"] = {"url": video_url, "path": video_path}
+
+    if st.session_state.get("vg_video"):
+        render_video(**st.session_state["vg_video"], key="vg_download")
+
+    # The store is shared by every session and replica
+    stored = list_stored_videos()
+    if stored:
+        with st.expander(f"📼 Stored videos ({len(stored)})"):
+            choice = st.selectbox(
+                "Video", range(len(stored)), key="vg_stored",
+                format_func=lambda i: f"{stored[i].get('model', '?')} · {stored[i].get('prompt', stored[i]['url'])[:60]}",
+            )
+            render_video(stored[choice]["url"], stored[choice]["path"], key="vg_stored_download")
+
+
+def render_video(url, path, key):
+    """Play and offer a stored video, falling back to the provider URL."""
+    data = None
+    if path:
+        try:
+            # Another replica may evict the file at any time
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            st.caption("The local copy was evicted; streaming from the provider.")
+    if data is None:
+        st.video(url)
+        return
+    st.video(data, format="video/mp4")
+    st.download_button("Download video", data, os.path.basename(path), "video/mp4", key=key)
+
 
 # --- UI: List Models Tab ---
-with tab7:
+@st.fragment
+def list_models_tab():
     st.header("📦 List Models")
     if st.button("Fetch Available Models"):
         with st.spinner("Fetching models..."):
@@ -366,17 +596,69 @@ with tab7:
                 st.success(f"Found {len(models.get('data', []))} models.")
                 st.json(models)
 
+
 # --- UI: Get Usage Tab ---
-with tab8:
+@st.fragment
+def usage_tab():
     st.header("📊 Get Usage")
-    from datetime import date, timedelta
     today = date.today()
     start_date = st.date_input("Start date", today - timedelta(days=30))
     end_date = st.date_input("End date", today)
 
     if st.button("Fetch Usage Data"):
+        if start_date > end_date:
+            st.warning("Start date must be before the end date.")
+            return
         with st.spinner("Fetching usage data..."):
-            # Format dates as YYYY-MM-DD strings
-            usage_data = get_usage(start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"))
-            if usage_data:
-                st.json(usage_data)
\ No newline at end of file
+            # Only today and days missing from the local cache hit the API
+            usage, fetched, failed, errors = load_usage(start_date, end_date, get_usage)
+        st.caption(f"{len(fetched)} day(s) fetched from the API, the rest served from cache.")
+        if failed:
+            st.warning(f"Could not fetch {len(failed)} day(s): {', '.join(d.isoformat() for d in failed)}")
+        for error in errors:
+            st.error(error)
+        if usage.empty:
+            st.info("No usage recorded in this range.")
+            return
+
+        totals = usage[["requests", "tokens", "cost"]].sum()
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Requests", f"{totals['requests']:,.0f}")
+        c2.metric("Tokens", f"{totals['tokens']:,.0f}")
+        c3.metric("Cost", f"${totals['cost']:,.4f}")
+
+        st.subheader("Cost per day by provider")
+        st.bar_chart(usage.pivot_table(index="day", columns="provider", values="cost", aggfunc="sum", observed=True))
+        st.subheader("Requests per day by endpoint")
+        st.bar_chart(usage.pivot_table(index="day", columns="endpoint", values="requests", aggfunc="sum", observed=True))
+        st.subheader("Totals by model")
+        by_model = usage.groupby(["provider", "model", "endpoint"], observed=True)[["requests", "tokens", "cost"]].sum()
+        st.dataframe(by_model.sort_values("cost", ascending=False), use_container_width=True)
+        with st.expander("Raw responses"):
+            st.json(raw_usage(start_date, end_date))
+
+
+# --- UI: Title & Tabs ---
+st.title("A4F API Suite")
+tab0, tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
+    "💬 Chat", "🖼️ Image Generation", "🎨 Image Edits", "🔡 Embeddings", "🗣️ Text-to-Speech",
+    "🎤 Speech-to-Text", "🎬 Video Generation", "📦 List Models", "📊 Get Usage"
+])
+with tab0:
+    chat_tab()
+with tab1:
+    image_generation_tab()
+with tab2:
+    image_edits_tab()
+with tab3:
+    embeddings_tab()
+with tab4:
+    tts_tab()
+with tab5:
+    stt_tab()
+with tab6:
+    video_tab()
+with tab7:
+    list_models_tab()
+with tab8:
+    usage_tab()
@@ -1,5 +1,9 @@
-import os, time, requests, streamlit as st
+import os, time, uuid, requests, streamlit as st
 from dotenv import load_dotenv
+import history_store
+import profiler
+from shared_state import throttle
+from singleflight import single_flight
 
 # ─── Load API Key ───────────────────────────────
 load_dotenv()
@@ -13,14 +17,30 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
-# ─── Session State Init ────────────────────────
-if "history" not in st.session_state:
-    st.session_state["history"] = []
+# ─── Profiling (Debug Mode) ─────────────────────
+# Debug widgets keep last run's values in session_state, so the whole script is covered
+if st.session_state.get("debug"):
+    profiler.start(
+        sampler=st.session_state.get("debug_sampler", "off"),
+        trace_memory=st.session_state.get("debug_memory", False),
+    )
+else:
+    profiler.release(st.session_state)
 
+# ─── Session State Init ────────────────────────
 if "enhanced" not in st.session_state:
     st.session_state["enhanced"] = ""
 
+# History owner id lives in the URL, so a refresh keeps "my images"
+if "history" not in st.query_params:
+    st.query_params["history"] = uuid.uuid4().hex[:12]
+history_id = st.query_params["history"]
+
 # ─── Helper: Prompt Enhancer ────────────────────
+# Preset prompts clicked in several sessions at once share one request.
+# Nothing is retained (ttl=0): clicking Enhance again should give a new take.
+@profiler.timed
+@single_flight(ttl=0, on_shared_failure=lambda: st.error("Enhancement failed. Please try again."))
 def enhance_prompt(user_prompt):
     url = "https://api.a4f.co/v1/chat/completions"
     payload = {
@@ -45,6 +65,7 @@ def enhance_prompt(user_prompt):
         "stream": False
     }
     try:
+        throttle(payload["model"])
         r = requests.post(url, headers=HEADERS, json=payload)
         r.raise_for_status()
         return r.json()["choices"][0]["message"]["content"]
@@ -56,10 +77,12 @@ def enhance_prompt(user_prompt):
         return None
 
 # ─── Helper: Image Generator ────────────────────
+@profiler.timed
 def generate_image(payload, max_retries=3):
     url = "https://api.a4f.co/v1/images/generations"
     delay = 1
     for _ in range(max_retries):
+        throttle(payload["model"])
         r = requests.post(url, json=payload, headers=HEADERS)
         if r.status_code == 200:
             return r.json()
@@ -75,7 +98,16 @@ st.set_page_config(layout="wide")
 st.title("🎨 A4F Image Generator + Prompt Enhancer")
 
 # ─── Debug and Theme Toggles ────────────────────
-debug = st.sidebar.checkbox("🐞 Debug Mode")
+debug = st.sidebar.checkbox("🐞 Debug Mode", key="debug")
+if debug:
+    st.sidebar.selectbox(
+        "⏱️ Profiler", profiler.SAMPLERS, key="debug_sampler",
+        help="Profiles this session's script thread only; `profile` slows the rerun it measures.",
+    )
+    st.sidebar.checkbox(
+        "🧠 Trace memory", key="debug_memory",
+        help="tracemalloc is process-wide: it slows every session while on.",
+    )
 dark = st.sidebar.checkbox("🌙 Dark Theme")
 if dark:
     st.markdown(
@@ -147,26 +179,59 @@ if st.button("🎨 Generate Images"):
             if not result:
                 st.error("⚠️ Server error. Try again.")
             else:
-                st.session_state["history"].append(result)
                 cols = st.columns(3)
+                images = []
                 for idx, data in enumerate(result["data"]):
                     with cols[idx % 3]:
                         if fmt == "url":
                             img_url = data["url"]
                             st.image(img_url, caption=f"Image {idx+1}", use_container_width=True)
-                            img_bytes = requests.get(img_url).content
+                            with profiler.span("download_image"):
+                                img_bytes = requests.get(img_url).content
+                            images.append(img_bytes)
                             st.download_button("⬇️ Download", img_bytes, f"image_{idx+1}.png", "image/png")
                         else:
                             st.image(data["b64_json"], caption=f"Image {idx+1}", use_container_width=True)
+                # Persist to the shared history in the background (reuses the bytes fetched above)
+                with profiler.span("record_history"):
+                    history_store.record_images_async("generation", payload, result, images or None, session=history_id)
 
 # ─── Image History View ─────────────────────────
+HISTORY_PAGE_SIZE = 12
+
 if st.checkbox("🕘 Show Image History"):
-    for run in st.session_state["history"]:
-        st.subheader("🖼️ Previous Generation")
-        cols = st.columns(3)
-        for idx, data in enumerate(run["data"]):
-            with cols[idx % 3]:
-                if fmt == "url":
-                    st.image(data["url"], caption=f"History Image {idx+1}", use_container_width=True)
-                else:
-                    st.image(data["b64_json"], caption=f"History Image {idx+1}", use_container_width=True)
+    # Only this session's images unless everyone's are asked for
+    everyone = st.checkbox("🌐 Include other users' images", value=False, key="hist_everyone")
+    owner = None if everyone else history_id
+    hcol1, hcol2 = st.columns(2)
+    search = hcol1.text_input("🔎 Search prompts", key="hist_search")
+    model_filter = hcol2.selectbox("📌 Model", ["All"] + history_store.models("generation", owner), key="hist_model")
+    collapse = st.checkbox("🧬 Collapse near-duplicates", value=True, key="hist_collapse")
+    filters = {
+        "kind":           "generation",
+        "session":        owner,
+        "text":           search,
+        "model":          None if model_filter == "All" else model_filter,
+        "originals_only": collapse,
+    }
+    with profiler.span("history_query"):
+        total = history_store.count(**filters)
+    pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages}, {total} images)", 1, pages, 1, key="hist_page")
+    with profiler.span("history_query"):
+        rows = history_store.query(limit=HISTORY_PAGE_SIZE, offset=(page - 1) * HISTORY_PAGE_SIZE, **filters)
+        repeats = history_store.duplicate_counts([r["id"] for r in rows], **filters) if collapse else {}
+    cols = st.columns(3)
+    for idx, row in enumerate(rows):
+        with cols[idx % 3]:
+            src = history_store.artifact_path(row["artifact"]) if row["artifact"] else row["params"].get("url")
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["ts"]))
+            st.image(src, caption=f"{row['model']} · {when}", use_container_width=True)
+            st.caption(row["prompt"])
+            if repeats.get(row["id"]):
+                st.caption(f"🧬 +{repeats[row['id']]} near-identical")
+
+# ─── Debug: Profile Panel ───────────────────────
+if debug:
+    profiler.finish(st.session_state)
+    profiler.render_panel(st.sidebar, st.session_state)
@@ -0,0 +1,131 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+# Preprocessed (image, mask) pairs keyed by content hash + target size
+CACHE_SIZE = 32
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def parse_size(size):
+    """'512x512' -> (512, 512)."""
+    width, height = (int(v) for v in size.lower().split("x"))
+    return width, height
+
+
+def _load(data, what):
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception as e:
+        raise ValueError(f"Could not read the {what}: {e}") from e
+    # Phone JPEGs are often stored sideways with an EXIF rotation flag
+    return ImageOps.exif_transpose(img)
+
+
+def _has_alpha(img):
+    return img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+
+
+def _encode_png(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+# --- Image: letterbox to the target size, re-encode as PNG ---
+# Padding instead of cropping keeps the whole upload (and any mask area near
+# its edges); the bars are opaque black so they are never treated as editable
+def prepare_image(img, size):
+    img = img.convert("RGBA" if _has_alpha(img) else "RGB")
+    fill = (0, 0, 0, 255) if img.mode == "RGBA" else (0, 0, 0)
+    return _encode_png(ImageOps.pad(img, parse_size(size), Image.LANCZOS, color=fill))
+
+
+# --- Mask: validate against the image and make sure it has an alpha channel ---
+def prepare_mask(mask_bytes, image_size, size):
+    """Return the mask as an RGBA PNG at `size`.
+
+    Transparent pixels mark the area to edit. Masks without an alpha channel
+    are treated as black/white: white areas become transparent (edited).
+    """
+    mask = _load(mask_bytes, "mask")
+    if mask.size != image_size:
+        raise ValueError(
+            f"Mask is {mask.size[0]}x{mask.size[1]} but the image is "
+            f"{image_size[0]}x{image_size[1]}; they must match."
+        )
+    if _has_alpha(mask):
+        mask = mask.convert("RGBA")
+    else:
+        alpha = ImageOps.invert(mask.convert("L"))
+        mask = Image.new("RGBA", mask.size, (0, 0, 0, 255))
+        mask.putalpha(alpha)
+    # Opaque bars: the letterboxed margins are kept, not edited
+    mask = ImageOps.pad(mask, parse_size(size), Image.LANCZOS, color=(0, 0, 0, 255))
+    if mask.getchannel("A").getextrema()[0] == 255:
+        raise ValueError("Mask has no transparent area, so nothing would be edited.")
+    return _encode_png(mask)
+
+
+# --- Content box: where the upload sits inside the letterboxed canvas ---
+def content_box(image_size, size):
+    """(left, top, right, bottom) of the padded image, as fractions of `size`.
+
+    Fractions, because edit results don't always come back at the requested
+    resolution. Mirrors ImageOps.pad's scaling and centring.
+    """
+    width, height = parse_size(size)
+    scale = min(width / image_size[0], height / image_size[1])
+    inner_w, inner_h = round(image_size[0] * scale), round(image_size[1] * scale)
+    left, top = (width - inner_w) // 2, (height - inner_h) // 2
+    return (left / width, top / height, (left + inner_w) / width, (top + inner_h) / height)
+
+
+def crop_to_content(data, box):
+    """Crop an edit result back to `box` (from content_box), dropping the bars.
+
+    Returns PNG bytes; returns `data` unchanged when there is nothing to crop.
+    """
+    if box == (0.0, 0.0, 1.0, 1.0):
+        return data
+    img = _load(data, "edited image")
+    w, h = img.size
+    return _encode_png(img.crop((
+        round(box[0] * w), round(box[1] * h), round(box[2] * w), round(box[3] * h),
+    )))
+
+
+def prepare_edit_inputs(image_bytes, mask_bytes, size):
+    """Letterbox/recompress an edit upload (and its optional mask) to `size`.
+
+    Returns `(image_png, mask_png_or_None, box)`, where `box` is the upload's
+    content_box for cropping the results with crop_to_content(). Raises
+    ValueError for unreadable files or a mask that the server would reject.
+    Results are cached by the SHA-256 of the inputs, so reruns and repeated
+    edits skip the work.
+    """
+    key = (
+        hashlib.sha256(image_bytes).hexdigest(),
+        hashlib.sha256(mask_bytes).hexdigest() if mask_bytes else None,
+        size,
+    )
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    img = _load(image_bytes, "image")
+    image_png = prepare_image(img, size)
+    mask_png = prepare_mask(mask_bytes, img.size, size) if mask_bytes else None
+    box = content_box(img.size, size)
+
+    with _lock:
+        _cache[key] = (image_png, mask_png, box)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return image_png, mask_png, box
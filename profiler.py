@@ -0,0 +1,273 @@
+"""Per-rerun profiling for Debug Mode.
+
+Call `start()` at the top of the script and `finish(st.session_state)` at
+the end. In between, API helpers decorated with `@timed` (or code wrapped in
+`span(name)`) are timed, so each rerun's wall time splits into script time
+and time spent in each helper. Optionally a profiler (the stdlib `profile`
+module, or pyinstrument if installed) runs over the script thread, and
+tracemalloc statistics show what allocated memory since the previous rerun.
+Every run also records the pickled size of each session_state key, which
+shows sessions that keep growing.
+"""
+import io
+import json
+import pickle
+import profile
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+SAMPLERS = ["off", "profile"] + (["pyinstrument"] if pyinstrument else [])
+MAX_RUNS = 50
+TOP_LINES = 15
+KEEP_LINES = 500
+RUNS_KEY = "_profiler_runs"
+MEMORY_KEY = "_profiler_memory"
+# Sessions that stop rerunning (closed tabs) stop counting as tracemalloc users
+MEMORY_IDLE = 600
+
+# The profile being recorded by this thread. Streamlit runs each rerun in a
+# fresh thread, so this never outlives the run that started it.
+_local = threading.local()
+
+# tracemalloc is process-wide, so who wants it is tracked across sessions
+_memory_lock = threading.Lock()
+_memory_sessions = {}
+
+
+class _ThreadProfile(profile.Profile):
+    """Deterministic profiler for the calling thread only.
+
+    cProfile on Python 3.12+ is built on sys.monitoring and records every
+    thread in the process (other sessions' reruns, background pools). The
+    pure-Python `profile` module hooks in with sys.setprofile, which only
+    affects the thread that calls it. It is slower, but only for the
+    profiled rerun.
+    """
+
+    def __init__(self):
+        super().__init__(timer=time.perf_counter)
+
+    def _trace_return(self, frame, t):
+        # Frames entered before start() (start itself, the script body) return
+        # without a matching call; skip them instead of failing an assertion
+        cur = self.cur
+        while cur is not None and cur[-2] is not frame:
+            cur = cur[-1]
+        if cur is None:
+            return 0
+        while self.cur[-2] is not frame:
+            profile.Profile.trace_dispatch_return(self, self.cur[-2], 0)
+        return profile.Profile.trace_dispatch_return(self, frame, t)
+
+    dispatch = {**profile.Profile.dispatch, "return": _trace_return, "c_return": _trace_return}
+
+    def start(self):
+        self.set_cmd("streamlit rerun")
+        sys.setprofile(self.dispatcher)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def output_text(self, unicode=True):
+        out = io.StringIO()
+        pstats.Stats(self, stream=out).sort_stats("cumulative").print_stats(30)
+        return out.getvalue()
+
+
+def _session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+def _update_memory_tracing(trace_memory):
+    """Register this session's choice; tracemalloc runs only while someone wants it."""
+    now = time.time()
+    with _memory_lock:
+        if trace_memory:
+            _memory_sessions[_session_id()] = now
+        else:
+            _memory_sessions.pop(_session_id(), None)
+        for session, seen in list(_memory_sessions.items()):
+            if now - seen > MEMORY_IDLE:
+                del _memory_sessions[session]
+        if _memory_sessions and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        elif not _memory_sessions and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def release(state=None):
+    """Debug Mode is off for this session: stop tracing memory on its behalf."""
+    _update_memory_tracing(False)
+    if state is not None:
+        state.pop(MEMORY_KEY, None)
+
+
+def start(sampler="off", trace_memory=False):
+    """Begin profiling the current rerun."""
+    run = {
+        "ts": time.time(), "wall": None, "script": None, "helpers": 0.0, "spans": {},
+        "sampler": sampler, "trace_memory": trace_memory,
+        "cpu_report": None, "memory": None, "state_sizes": {},
+    }
+    _local.run, _local.depth, _local.sampler = run, 0, None
+    # Both samplers only see this thread, and Streamlit gives every rerun a
+    # new thread, so a run that raised before finish() leaves nothing running
+    prof = None
+    if sampler == "profile":
+        prof = _ThreadProfile()
+    elif sampler == "pyinstrument" and pyinstrument:
+        prof = pyinstrument.Profiler()
+    if prof is not None:
+        try:
+            prof.start()
+            _local.sampler = prof
+        except RuntimeError as e:
+            run["cpu_report"] = f"{sampler} unavailable: {e}"
+    _update_memory_tracing(trace_memory)
+    _local.t0 = time.perf_counter()
+
+
+@contextmanager
+def span(name):
+    """Time a block under `name` in the current rerun's profile (no-op when off)."""
+    run = getattr(_local, "run", None)
+    if run is None:
+        yield
+        return
+    depth = _local.depth
+    _local.depth += 1
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        _local.depth -= 1
+        stats = run["spans"].setdefault(name, {"calls": 0, "seconds": 0.0})
+        stats["calls"] += 1
+        stats["seconds"] += elapsed
+        if depth == 0:
+            run["helpers"] += elapsed
+
+
+def timed(fn):
+    """Decorator: record every call of `fn` as a span named after it."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def _size(value):
+    try:
+        return len(pickle.dumps(value))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def _memory_report(state):
+    stats = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ]).statistics("lineno")
+    # Keep only {"file:line": bytes} for the largest lines, not the Snapshot
+    sizes = {f"{s.traceback[0].filename}:{s.traceback[0].lineno}": s.size for s in stats[:KEEP_LINES]}
+    previous = state.get(MEMORY_KEY)
+    state[MEMORY_KEY] = sizes
+    if previous is None:
+        top = [(line, size, None) for line, size in list(sizes.items())[:TOP_LINES]]
+    else:
+        growth = {line: size - previous.get(line, 0) for line, size in sizes.items()}
+        lines = sorted(growth, key=lambda line: abs(growth[line]), reverse=True)[:TOP_LINES]
+        top = [(line, sizes[line], growth[line]) for line in lines]
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "current": current, "peak": peak, "diff": previous is not None,
+        "top": [
+            f"{line}: {size / 1024:.1f} KiB" + ("" if diff is None else f" ({diff / 1024:+.1f} KiB)")
+            for line, size, diff in top
+        ],
+    }
+
+
+def finish(state):
+    """Close the current rerun's profile and append it to `state`."""
+    run = getattr(_local, "run", None)
+    if run is None:
+        return None
+    _local.run = None
+    run["wall"] = time.perf_counter() - _local.t0
+    run["script"] = run["wall"] - run["helpers"]
+
+    sampler, _local.sampler = _local.sampler, None
+    if sampler is not None:
+        sampler.stop()
+        run["cpu_report"] = sampler.output_text(unicode=True)
+
+    if run["trace_memory"] and tracemalloc.is_tracing():
+        run["memory"] = _memory_report(state)
+    else:
+        state.pop(MEMORY_KEY, None)
+    run["state_sizes"] = {
+        k: _size(v) for k, v in state.items() if not str(k).startswith("_profiler")
+    }
+    runs = state.setdefault(RUNS_KEY, [])
+    runs.append(run)
+    del runs[:-MAX_RUNS]
+    return run
+
+
+def render_panel(container, state):
+    """Sidebar panel for the recorded runs, with file exports."""
+    runs = state.get(RUNS_KEY, [])
+    if not runs:
+        return
+    last = runs[-1]
+    container.subheader("⏱️ Profile")
+    container.metric("Last rerun", f"{last['wall'] * 1000:.0f} ms", f"script {last['script'] * 1000:.0f} ms", delta_color="off")
+    if last["spans"]:
+        container.dataframe(
+            pd.DataFrame([{"helper": k, "calls": v["calls"], "ms": round(v["seconds"] * 1000, 1)} for k, v in last["spans"].items()]),
+            hide_index=True,
+        )
+
+    container.caption("Wall time per rerun (ms)")
+    container.line_chart(pd.DataFrame({
+        "script": [r["script"] * 1000 for r in runs],
+        "helpers": [r["helpers"] * 1000 for r in runs],
+    }))
+
+    container.caption("session_state size per rerun (KB)")
+    sizes = pd.DataFrame([r["state_sizes"] for r in runs]).fillna(0) / 1024
+    container.line_chart(sizes)
+
+    if last["memory"]:
+        mem = last["memory"]
+        container.caption(
+            f"tracemalloc: {mem['current'] / 1e6:.1f} MB now, {mem['peak'] / 1e6:.1f} MB peak"
+            + (" · growth since previous rerun" if mem["diff"] else "")
+        )
+        container.code("\n".join(mem["top"]) or "(no allocations)", language=None)
+    if last["cpu_report"]:
+        container.expander(f"Call profile ({last['sampler']}, this rerun's thread only)").code(last["cpu_report"][:20000], language=None)
+
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(last["ts"]))
+    container.download_button(
+        "⬇️ Export runs (JSON)", json.dumps(runs, indent=2), f"profile-{stamp}.json", "application/json",
+    )
+    if last["cpu_report"]:
+        container.download_button("⬇️ Export CPU profile", last["cpu_report"], f"cpu-{stamp}.txt", "text/plain")
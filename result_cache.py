@@ -0,0 +1,24 @@
+import hashlib
+import json
+import os
+
+from shared_state import get_state
+
+# Provider image URLs expire, so cached responses do too
+CACHE_TTL = int(os.getenv("A4F_RESULT_TTL", 24 * 3600))
+
+
+def payload_key(payload):
+    """Stable key for an API payload (dict key order doesn't matter)."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+# Stored in the shared-state backend so every replica sees the same results
+def get(payload):
+    """Return the record stored for `payload`, or None if missing/expired."""
+    return get_state().get(f"result:{payload_key(payload)}")
+
+
+def put(payload, record):
+    """Store a JSON-serialisable record for `payload`."""
+    get_state().set(f"result:{payload_key(payload)}", record, ttl=CACHE_TTL)
@@ -0,0 +1,284 @@
+"""State shared by every Streamlit process behind the load balancer.
+
+Backs the result cache, the per-provider rate limiters and job metadata, and
+provides cross-process locks. The backend is chosen by A4F_SHARED_STATE:
+
+    sqlite:///data/shared.db   (default; processes on one host / shared disk)
+    redis://[:password@]host:6379/0
+
+The Redis backend speaks RESP directly over a socket, so it works against a
+real Redis or any local stand-in that implements GET/SET/DEL/EVAL.
+"""
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+DATA_DIR = os.getenv("A4F_DATA_DIR", "data")
+STATE_URL = os.getenv("A4F_SHARED_STATE", f"sqlite:///{os.path.join(DATA_DIR, 'shared.db')}")
+# Requests per minute per provider (or other bucket such as "usage"),
+# e.g. A4F_RATE_LIMITS='{"provider-6": 20, "usage": 10}'
+RATE_LIMITS = json.loads(os.getenv("A4F_RATE_LIMITS", "{}"))
+DEFAULT_RATE_LIMIT = int(os.getenv("A4F_DEFAULT_RPM", 60))
+
+
+class _Backend:
+    """get/set/delete of JSON values with optional TTL, plus named locks."""
+
+    # Idle connections kept for reuse by any thread
+    POOL_SIZE = 4
+
+    @contextmanager
+    def lock(self, name, ttl=60, timeout=None):
+        """Cross-process mutex; expires after `ttl` seconds if the holder dies."""
+        token = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._try_lock(f"lock:{name}", token, ttl):
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Could not acquire lock {name!r}")
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            self._unlock(f"lock:{name}", token)
+
+
+# --- SQLite backend ---
+class SQLiteState(_Backend):
+    # Expired rows are skipped by get(); deleting them is housekeeping
+    PRUNE_INTERVAL = 60
+
+    def __init__(self, path):
+        self.path = path
+        # Shared by all threads: Streamlit runs every rerun in a new thread
+        self._pool = queue.LifoQueue()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._next_prune = 0.0
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv(expires)")
+                self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def _conn(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if self._pool.qsize() < self.POOL_SIZE:
+                self._pool.put(conn)
+            else:
+                conn.close()
+
+    def get(self, key):
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl if ttl else None),
+            )
+            if now >= self._next_prune:
+                self._next_prune = now + self.PRUNE_INTERVAL
+                conn.execute("DELETE FROM kv WHERE expires < ?", (now,))
+
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _try_lock(self, key, token, ttl):
+        now = time.time()
+        with self._conn() as conn:
+            # BEGIN IMMEDIATE takes SQLite's write lock, making check-and-set atomic
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM kv WHERE key = ? AND expires < ?", (key, now))
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                    (key, json.dumps(token), now + ttl),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return cur.rowcount == 1
+
+    def _unlock(self, key, token):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, json.dumps(token)))
+
+
+# --- Redis backend (RESP over a plain socket) ---
+class RedisError(Exception):
+    pass
+
+
+_UNLOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class RedisState(_Backend):
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        # Idle connections shared by all threads (one command at a time each)
+        self._pool = queue.LifoQueue()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=10)
+        stream = sock.makefile("rwb")
+        sock.close()  # The file object keeps the socket open
+        if self.password:
+            self._call(stream, "AUTH", self.password)
+        if self.db:
+            self._call(stream, "SELECT", self.db)
+        return stream
+
+    def _call(self, stream, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        stream.write(b"".join(parts))
+        stream.flush()
+        return self._read(stream)
+
+    def _read(self, stream):
+        line = stream.readline()
+        if not line:
+            raise RedisError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = stream.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length == -1 else [self._read(stream) for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def command(self, *args):
+        try:
+            stream = self._pool.get_nowait()
+        except queue.Empty:
+            stream = self._connect()
+        try:
+            reply = self._call(stream, *args)
+        except (OSError, RedisError):
+            # Drop a possibly broken connection; the next call reconnects
+            stream.close()
+            raise
+        if self._pool.qsize() < self.POOL_SIZE:
+            self._pool.put(stream)
+        else:
+            stream.close()
+        return reply
+
+    def get(self, key):
+        value = self.command("GET", key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        args = ["SET", key, json.dumps(value)]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        self.command(*args)
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+    def _try_lock(self, key, token, ttl):
+        return self.command("SET", key, json.dumps(token), "NX", "PX", int(ttl * 1000)) == "OK"
+
+    def _unlock(self, key, token):
+        self.command("EVAL", _UNLOCK_SCRIPT, 1, key, json.dumps(token))
+
+
+# --- Backend selection ---
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_state():
+    """Process-wide backend configured by A4F_SHARED_STATE."""
+    global _state
+    with _state_lock:
+        if _state is None:
+            if STATE_URL.startswith("redis://"):
+                _state = RedisState(STATE_URL)
+            elif STATE_URL.startswith("sqlite:///"):
+                _state = SQLiteState(STATE_URL[len("sqlite:///"):])
+            else:
+                raise ValueError(f"Unsupported A4F_SHARED_STATE: {STATE_URL}")
+        return _state
+
+
+# --- Rate limiting ---
+class RateLimiter:
+    """Token bucket shared by all processes using the same backend."""
+
+    def __init__(self, name, per_minute, burst=None, state=None):
+        self.key = f"ratelimit:{name}"
+        self.rate = per_minute / 60.0
+        self.burst = burst or max(1, per_minute // 6)
+        self.state = state or get_state()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self.state.lock(self.key, ttl=5):
+                now = time.time()
+                bucket = self.state.get(self.key) or {"tokens": self.burst, "ts": now}
+                tokens = min(self.burst, bucket["tokens"] + (now - bucket["ts"]) * self.rate)
+                if tokens >= 1:
+                    self.state.set(self.key, {"tokens": tokens - 1, "ts": now}, ttl=3600)
+                    return
+                self.state.set(self.key, {"tokens": tokens, "ts": now}, ttl=3600)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+def rate_limit(name):
+    """Wait for the shared rate limit of bucket `name` (a provider, or e.g. "usage")."""
+    RateLimiter(name, RATE_LIMITS.get(name, DEFAULT_RATE_LIMIT)).acquire()
+
+
+def throttle(model):
+    """Wait for the shared rate limit of `model`'s provider ("provider-6/..." -> "provider-6")."""
+    if not model:
+        return
+    rate_limit(model.split("/")[0])
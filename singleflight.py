@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from functools import wraps
+
+
+# --- In-flight call record ---
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Leader was interrupted by a control-flow exception (e.g. a rerun)
+        self.aborted = False
+
+
+# --- Single-flight group ---
+class SingleFlight:
+    """Collapse concurrent identical calls into one in-flight call.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait and receive the same result (or exception).
+    Only ordinary exceptions are shared: if the leader is interrupted by
+    something else (Streamlit's StopException/RerunException belong to the
+    leader's own session), the waiters retry and one of them becomes leader.
+    Successful, non-None results are retained for `ttl` seconds so a burst of
+    callers arriving just after the leader finished also share them.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._results = {}
+
+    def do(self, key, fn, ttl=None):
+        """Run `fn()` once for `key` across all concurrent callers."""
+        return self.do_shared(key, fn, ttl)[0]
+
+    def do_shared(self, key, fn, ttl=None):
+        """Like do(), but returns `(value, shared)`; `shared` is True when the
+        value came from another caller's call (in flight or retained)."""
+        ttl = self.ttl if ttl is None else ttl
+        while True:
+            with self._lock:
+                hit = self._results.get(key)
+                if hit and hit[0] > time.monotonic():
+                    return hit[1], True
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+
+            if leader:
+                break
+            call.done.wait()
+            if call.aborted:
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.aborted = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                now = time.monotonic()
+                self._results = {k: v for k, v in self._results.items() if v[0] > now}
+                # Failed calls (make_request returns None) are never retained
+                if call.error is None and not call.aborted and call.value is not None and ttl > 0:
+                    self._results[key] = (now + ttl, call.value)
+            call.done.set()
+        return call.value, False
+
+    def forget(self, key):
+        """Drop a retained result so the next call goes to the server."""
+        with self._lock:
+            self._results.pop(key, None)
+
+
+# Process-wide group: shared by every Streamlit session in this server process
+GROUP = SingleFlight()
+
+
+def default_key(fn, args, kwargs):
+    # Scripts all run as __main__, so the file name keeps helpers from
+    # different apps (e.g. kimi.py vs img1.py enhance_prompt) apart.
+    return json.dumps(
+        [fn.__code__.co_filename, fn.__qualname__, args, kwargs],
+        sort_keys=True, default=str,
+    )
+
+
+def single_flight(key=None, ttl=None, group=None, on_shared_failure=None):
+    """Decorator: share one in-flight call between identical concurrent calls.
+
+    `key(*args, **kwargs)` builds the coalescing key (defaults to the function
+    plus its JSON-encoded arguments); `ttl` overrides the group's retention
+    (0 coalesces in-flight calls only). Helpers that report errors with
+    st.error and return None only show that error in the leader's session;
+    `on_shared_failure()` is called in each waiter that got that None, so
+    their sessions don't fail silently.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs) if key else default_key(fn, args, kwargs)
+            value, shared = (group or GROUP).do_shared(k, lambda: fn(*args, **kwargs), ttl=ttl)
+            if value is None and shared and on_shared_failure:
+                on_shared_failure()
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,302 @@
+"""Prompt × parameter sweeps for image generation.
+
+A spec such as
+
+    {"name": "cats", "prompts": ["a cat", "a tabby cat"],
+     "models": ["provider-4/imagen-4", "provider-1/FLUX.1-schnell"],
+     "sizes": ["512x512"], "qualities": ["standard", "hd"], "n": 1}
+
+expands into one job per prompt/model/size/quality cell. Finished cells are
+recorded in `<out_dir>/manifest.json`, so re-running (or extending) a sweep
+only generates the cells that are new or failed. Every run also writes a
+`contact_sheet.png` grid with one column per model and image.
+
+Headless: python sweep.py spec.json [--out DIR]
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import requests
+from dotenv import load_dotenv
+from PIL import Image, ImageDraw
+
+import history_store
+from fingerprint import collapse, fingerprints
+import result_cache
+from shared_state import DATA_DIR, get_state, throttle
+
+load_dotenv()
+API_KEY = os.getenv("A4F_API_KEY")
+HEADERS = {
+    "Authorization": f"Bearer {API_KEY}",
+    "Content-Type": "application/json",
+}
+
+SWEEP_DIR = os.path.join(DATA_DIR, "sweeps")
+# Concurrent requests per provider ("provider-6/sana-1.5" -> "provider-6")
+PROVIDER_LIMITS = {"default": 2}
+MAX_WORKERS = 8
+THUMB = 256
+
+
+# --- Helper: Image Generator with Retry ---
+def generate_image(payload, max_retries=3):
+    url = "https://api.a4f.co/v1/images/generations"
+    delay = 1
+    for _ in range(max_retries):
+        throttle(payload.get("model"))
+        r = requests.post(url, json=payload, headers=HEADERS)
+        if r.status_code == 200:
+            return r.json()
+        if r.status_code == 500:
+            time.sleep(delay); delay *= 2; continue
+        r.raise_for_status()
+    return None
+
+
+# --- Spec expansion ---
+def expand(spec):
+    """Spec -> list of unique jobs, in grid order."""
+    jobs = {}
+    for prompt, size, quality, model in itertools.product(
+        spec["prompts"],
+        spec.get("sizes", ["1024x1024"]),
+        spec.get("qualities", ["standard"]),
+        spec["models"],
+    ):
+        payload = {
+            "model": model, "prompt": prompt, "n": spec.get("n", 1),
+            "size": size, "quality": quality,
+            "response_format": spec.get("response_format", "url"),
+        }
+        jobs.setdefault(result_cache.payload_key(payload), payload)
+    return [{"key": k, "payload": p} for k, p in jobs.items()]
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"cells": []}
+
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, "manifest.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def _is_done(cell, out_dir):
+    return cell["status"] == "ok" and all(
+        os.path.exists(os.path.join(out_dir, p)) for p in cell["images"]
+    )
+
+
+# --- Job execution ---
+def _run_job(job, out_dir, generate):
+    payload = job["payload"]
+    cell = {
+        "key": job["key"], "model": payload["model"], "prompt": payload["prompt"],
+        "size": payload["size"], "quality": payload["quality"],
+        "status": "error", "cached": False, "latency": None, "images": [], "error": None,
+    }
+    try:
+        record = result_cache.get(payload)
+        if record:
+            cell["cached"] = True
+        else:
+            start = time.perf_counter()
+            result = generate(payload)
+            record = {"result": result, "latency": time.perf_counter() - start, "cost": None}
+            if not result or "data" not in result:
+                raise RuntimeError("No images returned")
+            result_cache.put(payload, record)
+        cell["latency"] = record["latency"]
+        images = []
+        for idx, data in enumerate(record["result"]["data"]):
+            rel = os.path.join("images", f"{job['key'][:16]}_{idx}.png")
+            images.append(history_store.fetch_image(data))
+            with open(os.path.join(out_dir, rel), "wb") as f:
+                f.write(images[-1])
+            cell["images"].append(rel)
+            hashes = fingerprints(images[-1])
+            cell.setdefault("phash", []).append(hashes["phash"] if hashes else None)
+        if not cell["cached"]:
+            history_store.record_images("generation", {**payload, "sweep": out_dir}, record["result"], images)
+        cell["status"] = "ok"
+    except Exception as e:
+        cell["error"] = str(e)
+    return cell
+
+
+def run_sweep(spec, out_dir=None, generate=None, progress=None, lock_timeout=None):
+    """Run every cell of `spec` that isn't already done; return the manifest.
+
+    `generate(payload)` defaults to this module's HTTP helper;
+    `progress(cell, finished, total)` is called as each cell completes.
+    Raises TimeoutError if another runner holds the sweep for longer than
+    `lock_timeout` seconds (default: wait for it).
+    """
+    out_dir = out_dir or os.path.join(SWEEP_DIR, spec.get("name", "sweep"))
+    os.makedirs(os.path.join(out_dir, "images"), exist_ok=True)
+    # One runner per sweep across all replicas; a second caller waits, then
+    # finds the cells already done
+    with get_state().lock(f"sweep:{os.path.abspath(out_dir)}", ttl=6 * 3600, timeout=lock_timeout):
+        return _run_sweep(spec, out_dir, generate or generate_image, progress)
+
+
+# A "running" status this old means the runner died without a final status
+# (e.g. the process was killed)
+STALE_AFTER = 30 * 60
+
+
+def job_status(out_dir):
+    """Shared job metadata for a sweep (status, progress, host/pid), or None."""
+    status = get_state().get(f"job:sweep:{os.path.abspath(out_dir)}")
+    if status and status["status"] == "running" and time.time() - status["updated"] > STALE_AFTER:
+        status["status"] = "interrupted"
+    return status
+
+
+def _set_job_status(out_dir, **fields):
+    get_state().set(f"job:sweep:{os.path.abspath(out_dir)}", {
+        **fields, "host": socket.gethostname(), "pid": os.getpid(), "updated": time.time(),
+    }, ttl=7 * 24 * 3600)
+
+
+def _run_sweep(spec, out_dir, generate, progress):
+
+    jobs = expand(spec)
+    previous = {c["key"]: c for c in load_manifest(out_dir)["cells"]}
+    cells = {k: c for k, c in previous.items() if _is_done(c, out_dir)}
+    pending = [j for j in jobs if j["key"] not in cells]
+
+    limits = {**PROVIDER_LIMITS, **spec.get("concurrency", {})}
+    semaphores = {}
+    lock = threading.Lock()
+
+    def provider_slot(model):
+        provider = model.split("/")[0]
+        with lock:
+            if provider not in semaphores:
+                semaphores[provider] = threading.Semaphore(limits.get(provider, limits["default"]))
+            return semaphores[provider]
+
+    def run(job):
+        with provider_slot(job["payload"]["model"]):
+            return _run_job(job, out_dir, generate)
+
+    manifest = {"spec": spec, "cells": []}
+    finished = len(jobs) - len(pending)
+    _set_job_status(out_dir, status="running", finished=finished, total=len(jobs))
+    final = {"status": "failed", "failed": None}
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            for future in as_completed([pool.submit(run, j) for j in pending]):
+                cell = future.result()
+                finished += 1
+                with lock:
+                    cells[cell["key"]] = cell
+                    # Keep cells from earlier, larger specs so shrinking a sweep loses nothing
+                    manifest["cells"] = list({**previous, **cells}.values())
+                    _write_manifest(out_dir, manifest)
+                _set_job_status(out_dir, status="running", finished=finished, total=len(jobs))
+                if progress:
+                    progress(cell, finished, len(jobs))
+
+        ordered = [cells[j["key"]] for j in jobs if j["key"] in cells]
+        sheet, skipped = build_contact_sheet(
+            ordered, out_dir, columns=len(spec["models"]) * spec.get("n", 1), per_cell=spec.get("n", 1),
+        )
+        manifest["cells"] = list({**previous, **cells}.values())
+        manifest["contact_sheet"] = sheet and os.path.basename(sheet)
+        manifest["near_duplicates_skipped"] = skipped
+        manifest["updated"] = datetime.now(timezone.utc).isoformat()
+        _write_manifest(out_dir, manifest)
+        failed = sum(c["status"] != "ok" for c in ordered) + len(jobs) - len(ordered)
+        final = {"status": "done" if not failed else "partial", "failed": failed}
+    finally:
+        # Never leave the shared status at "running" (errors, reruns, Ctrl-C)
+        _set_job_status(out_dir, finished=finished, total=len(jobs), **final)
+    return manifest
+
+
+# --- Contact sheet ---
+def build_contact_sheet(cells, out_dir, columns, per_cell=1):
+    """Tile the images of `cells` into contact_sheet.png with a caption each.
+
+    Every cell takes `per_cell` slots, so columns stay aligned with models.
+    Failed cells and near-duplicate images (by pHash) keep their slot as a
+    placeholder tile; returns (path, skipped near-duplicates).
+    """
+    slots = []  # (cell, image path or None, placeholder text)
+    for cell in cells:
+        images = cell["images"] if cell["status"] == "ok" else []
+        phashes = cell.get("phash") or [None] * len(images)
+        for i in range(per_cell):
+            if i < len(images):
+                slots.append([cell, images[i], phashes[i]])
+            else:
+                slots.append([cell, None, "failed" if cell["status"] != "ok" else "no image"])
+    hashed = [i for i, s in enumerate(slots) if s[1] and s[2] is not None]
+    labels = collapse([slots[i][2] for i in hashed])
+    skipped = 0
+    for j, label in enumerate(labels):
+        if label != j:
+            original = slots[hashed[label]][0]
+            slots[hashed[j]][1:] = None, f"dup of {original['model'].split('/')[-1]} {original['size']} {original['quality']}"
+            skipped += 1
+    if not any(s[1] for s in slots):
+        return None, skipped
+    columns = max(1, min(columns, len(slots)))
+    rows = -(-len(slots) // columns)
+    label_h = 36
+    sheet = Image.new("RGB", (columns * THUMB, rows * (THUMB + label_h)), "white")
+    draw = ImageDraw.Draw(sheet)
+    for idx, (cell, rel, note) in enumerate(slots):
+        x, y = (idx % columns) * THUMB, (idx // columns) * (THUMB + label_h)
+        if rel:
+            with Image.open(os.path.join(out_dir, rel)) as img:
+                img = img.convert("RGB")
+                img.thumbnail((THUMB, THUMB))
+                sheet.paste(img, (x + (THUMB - img.width) // 2, y + (THUMB - img.height) // 2))
+        else:
+            draw.rectangle((x + 4, y + 4, x + THUMB - 5, y + THUMB - 5), fill="#eeeeee", outline="#cccccc")
+            draw.text((x + 12, y + THUMB // 2 - 6), note, fill="gray")
+        draw.text((x + 4, y + THUMB + 2), f"{cell['model'].split('/')[-1]} {cell['size']} {cell['quality']}", fill="black")
+        draw.text((x + 4, y + THUMB + 18), cell["prompt"][:40], fill="gray")
+    path = os.path.join(out_dir, "contact_sheet.png")
+    sheet.save(path)
+    return path, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an image generation sweep.")
+    parser.add_argument("spec", help="path to a JSON sweep spec")
+    parser.add_argument("--out", help="output directory (default: data/sweeps/<name>)")
+    args = parser.parse_args()
+    if not API_KEY:
+        parser.error("Missing A4F_API_KEY in your environment.")
+    with open(args.spec, encoding="utf-8") as f:
+        spec = json.load(f)
+
+    def progress(cell, finished, total):
+        status = cell["status"] if not cell["error"] else f"error: {cell['error']}"
+        print(f"[{finished}/{total}] {cell['model']} {cell['size']} {cell['quality']} - {status}")
+
+    manifest = run_sweep(spec, args.out, progress=progress)
+    ok = sum(c["status"] == "ok" for c in manifest["cells"])
+    print(f"{ok}/{len(manifest['cells'])} cells done; contact sheet: {manifest['contact_sheet']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Minimal in-process Redis stand-in for testing RedisState.
+
+Speaks RESP over TCP and implements just the commands RedisState uses:
+AUTH, SELECT, GET, SET (with NX and PX), DEL and EVAL of the unlock script.
+"""
+import socketserver
+import threading
+import time
+
+from shared_state import _UNLOCK_SCRIPT
+
+
+class Status(str):
+    """Simple-string reply (+OK); plain str values are sent as bulk strings."""
+
+
+class Error(str):
+    """Error reply (-ERR ...)."""
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.password = password
+        self.data = {}  # key -> (value, expires or None)
+        self.lock = threading.Lock()
+        self.commands = []
+
+    @property
+    def url(self):
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{self.server_address[1]}/0"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    def _get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args):
+        name = args[0].upper()
+        self.commands.append(name)
+        with self.lock:
+            if name == "AUTH":
+                return Status("OK") if args[1] == self.password else Error("WRONGPASS invalid password")
+            if name == "SELECT":
+                return Status("OK")
+            if name == "GET":
+                return self._get(args[1])
+            if name == "DEL":
+                return sum(self.data.pop(k, None) is not None for k in args[1:])
+            if name == "SET":
+                key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+                if "NX" in options and self._get(key) is not None:
+                    return None
+                expires = None
+                if "PX" in options:
+                    expires = time.monotonic() + int(args[3 + options.index("PX") + 1]) / 1000
+                self.data[key] = (value, expires)
+                return Status("OK")
+            if name == "EVAL" and args[1] == _UNLOCK_SCRIPT:
+                key, token = args[3], args[4]
+                if self._get(key) == token:
+                    del self.data[key]
+                    return 1
+                return 0
+        return Error(f"ERR unknown command '{name}'")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            self.wfile.write(_encode(self.server.execute(args)))
+
+
+def _encode(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, Status):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, Error):
+        return b"-%s\r\n" % reply.encode()
+    data = reply.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
@@ -0,0 +1,42 @@
+"""Letterboxing edit uploads and cropping the results back.
+
+Run from the repository root: python -m unittest discover tests
+"""
+import io
+import unittest
+
+from PIL import Image
+
+import preprocess
+
+
+def _png(size, color="red"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class LetterboxCropTest(unittest.TestCase):
+    def test_crop_removes_bars_at_any_result_resolution(self):
+        image_png, _, box = preprocess.prepare_edit_inputs(_png((300, 200)), None, "1024x1024")
+        padded = Image.open(io.BytesIO(image_png))
+        self.assertEqual(padded.size, (1024, 1024))
+        self.assertEqual(padded.convert("RGB").getpixel((512, 0)), (0, 0, 0))
+
+        # The API may answer at another resolution than the one asked for
+        result = io.BytesIO()
+        padded.resize((512, 512)).save(result, "PNG")
+        cropped = Image.open(io.BytesIO(preprocess.crop_to_content(result.getvalue(), box)))
+        self.assertEqual(cropped.size, (512, 341))
+        for xy in ((0, 2), (511, 338), (256, 170)):
+            self.assertGreater(cropped.convert("RGB").getpixel(xy)[0], 200)
+
+    def test_square_upload_is_left_alone(self):
+        _, _, box = preprocess.prepare_edit_inputs(_png((64, 64), "blue"), None, "256x256")
+        self.assertEqual(box, (0.0, 0.0, 1.0, 1.0))
+        data = _png((256, 256))
+        self.assertIs(preprocess.crop_to_content(data, box), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
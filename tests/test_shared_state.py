@@ -0,0 +1,74 @@
+"""RedisState against the in-process RESP stand-in.
+
+Run from the repository root: python -m unittest discover tests
+"""
+import threading
+import time
+import unittest
+
+from shared_state import RedisError, RedisState
+from tests.fake_redis import FakeRedis
+
+
+class RedisStateTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeRedis(password="secret").__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.state = RedisState(self.server.url)
+
+    def test_get_set_delete(self):
+        self.assertIsNone(self.state.get("missing"))
+        self.state.set("k", {"tokens": 2.5, "items": [1, "a"]})
+        self.assertEqual(self.state.get("k"), {"tokens": 2.5, "items": [1, "a"]})
+        self.state.set("n", -1)
+        self.assertEqual(self.state.get("n"), -1)
+        self.state.delete("k")
+        self.assertIsNone(self.state.get("k"))
+        self.assertEqual(self.server.commands[0], "AUTH")
+
+    def test_ttl(self):
+        self.state.set("short", "v", ttl=0.05)
+        self.state.set("long", "v", ttl=60)
+        self.assertEqual(self.state.get("short"), "v")
+        time.sleep(0.1)
+        self.assertIsNone(self.state.get("short"))
+        self.assertEqual(self.state.get("long"), "v")
+
+    def test_lock_excludes_and_unlocks(self):
+        with self.state.lock("job"):
+            with self.assertRaises(TimeoutError):
+                with self.state.lock("job", timeout=0.1):
+                    pass
+        with self.state.lock("job", timeout=0.1):
+            pass
+        self.assertIsNone(self.state.get("lock:job"))
+
+    def test_unlock_keeps_a_newer_holders_lock(self):
+        # The first holder's lock expired and someone else took it
+        self.assertTrue(self.state._try_lock("lock:x", "old", ttl=0.05))
+        time.sleep(0.1)
+        self.assertTrue(self.state._try_lock("lock:x", "new", ttl=60))
+        self.state._unlock("lock:x", "old")
+        self.assertEqual(self.state.get("lock:x"), "new")
+
+    def test_lock_is_mutually_exclusive_across_threads(self):
+        def work():
+            for _ in range(20):
+                with self.state.lock("counter"):
+                    self.state.set("n", (self.state.get("n") or 0) + 1)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.state.get("n"), 80)
+
+    def test_bad_password(self):
+        state = RedisState(self.server.url.replace("secret", "wrong"))
+        with self.assertRaises(RedisError):
+            state.get("k")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Freshness rules of the per-day usage cache.
+
+Run from the repository root: python -m unittest discover tests
+"""
+import os
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+import usage_cache
+
+
+def _records(day):
+    return {"data": [{"date": day.isoformat(), "model": "provider-1/x", "requests": 1}]}
+
+
+class UsageCacheFreshnessTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(usage_cache, "USAGE_DIR", tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.day = date(2026, 10, 10)
+        self.end = usage_cache._day_end(self.day)
+
+    def _store_fetched_at(self, ts):
+        usage_cache._store(self.day, _records(self.day))
+        os.utime(usage_cache._paths(self.day)[1], (ts, ts))
+
+    def test_missing_day_is_stale(self):
+        self.assertFalse(usage_cache._is_fresh(self.day, now=self.end + 86400))
+
+    def test_day_fetched_while_current_is_refetched_after_midnight(self):
+        # Cached at 15:00 while it was still "today"
+        self._store_fetched_at(self.end - 9 * 3600)
+        self.assertFalse(usage_cache._is_fresh(self.day, now=self.end + 3600))
+        self.assertFalse(usage_cache._is_fresh(self.day, now=self.end + 30 * 86400))
+
+    def test_day_fetched_within_grace_period_is_refetched(self):
+        self._store_fetched_at(self.end + 60)
+        self.assertTrue(usage_cache._is_fresh(self.day, now=self.end + 120))
+        self.assertFalse(usage_cache._is_fresh(self.day, now=self.end + 60 + usage_cache.TODAY_TTL))
+
+    def test_day_fetched_after_settling_is_final(self):
+        self._store_fetched_at(self.end + usage_cache.SETTLE_SECONDS)
+        self.assertTrue(usage_cache._is_fresh(self.day, now=self.end + 365 * 86400))
+
+    def test_load_usage_refetches_partial_past_day(self):
+        self._store_fetched_at(self.end - 9 * 3600)
+        settled = self.day - timedelta(days=1)
+        usage_cache._store(settled, _records(settled))
+        final = usage_cache._day_end(settled) + usage_cache.SETTLE_SECONDS
+        os.utime(usage_cache._paths(settled)[1], (final, final))
+
+        calls = []
+
+        def fetch(start, end):
+            calls.append((start, end))
+            return _records(self.day)
+
+        df, fetched, failed, errors = usage_cache.load_usage(settled, self.day, fetch)
+        self.assertEqual(calls, [(self.day.isoformat(), self.day.isoformat())])
+        self.assertEqual((fetched, failed, errors), ([self.day], [], []))
+        self.assertEqual(df["requests"].sum(), 2)
+        self.assertGreater(os.path.getmtime(usage_cache._paths(self.day)[1]), time.time() - 60)
+
+
+    def test_load_usage_reports_fetch_errors(self):
+        def fetch(start, end):
+            raise RuntimeError("HTTP 429")
+
+        df, fetched, failed, errors = usage_cache.load_usage(self.day, self.day, fetch)
+        self.assertTrue(df.empty)
+        self.assertEqual((fetched, failed, errors), ([], [self.day], ["HTTP 429"]))
+
+    def test_epoch_timestamps_bucket_by_utc_day(self):
+        # 23:30 UTC on the 10th is already the 11th east of UTC
+        ts = usage_cache._day_end(self.day) - 1800
+        self.assertEqual(usage_cache._record_day({"timestamp": ts}), self.day)
+        self.assertEqual(usage_cache._record_day({"timestamp": ts * 1000}), self.day)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+"""Incremental, per-day cache of /v1/usage results.
+
+Each day is stored under `data/usage/`: its raw records as JSON and their
+pre-aggregated rows (day × provider × model × endpoint) as Parquet. A day
+fetched at least SETTLE_SECONDS after it ended (UTC) is final and never
+fetched again; anything fetched earlier (today, or a day first cached while
+it was still today) is refetched after TODAY_TTL seconds. A range query only
+hits the API for those days and days that are missing, asking for each contiguous run of them in one call and
+splitting the response by the date on each record. Responses whose records
+carry no date fall back to one call per day.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dt_time, timedelta, timezone
+
+import pandas as pd
+
+from shared_state import DATA_DIR
+
+USAGE_DIR = os.path.join(DATA_DIR, "usage")
+TODAY_TTL = 300
+# Usage can be posted late, so a day only counts as final once it was
+# fetched this long after it ended
+SETTLE_SECONDS = int(os.getenv("A4F_USAGE_SETTLE_HOURS", 6)) * 3600
+MAX_WORKERS = 4
+# Longest range asked for in one call
+MAX_RANGE_DAYS = 31
+DATE_FIELDS = ("date", "day", "created_at", "timestamp")
+COLUMNS = ["day", "provider", "model", "endpoint", "requests", "tokens", "cost"]
+TOKEN_FIELDS = ("tokens", "prompt_tokens", "completion_tokens", "input_tokens", "output_tokens")
+
+
+def _paths(day):
+    return (
+        os.path.join(USAGE_DIR, f"{day.isoformat()}.json"),
+        os.path.join(USAGE_DIR, f"{day.isoformat()}.parquet"),
+    )
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _records(raw):
+    """Find the list of usage records in a response of unknown shape."""
+    if isinstance(raw, list):
+        return [r for r in raw if isinstance(r, dict)]
+    if not isinstance(raw, dict):
+        return []
+    for key in ("data", "usage", "records", "items"):
+        if isinstance(raw.get(key), list):
+            return [r for r in raw[key] if isinstance(r, dict)]
+    # A single summary object for the day
+    return [raw]
+
+
+def _record_day(rec):
+    """Day a usage record belongs to, or None if it doesn't say."""
+    for field in DATE_FIELDS:
+        value = rec.get(field)
+        if value in (None, ""):
+            continue
+        try:
+            if isinstance(value, (int, float)):
+                # Unix time, in seconds or milliseconds
+                # (bucketed in UTC like the API's days, not server local time)
+                ts = value / 1000 if value > 1e11 else value
+                return datetime.fromtimestamp(ts, tz=timezone.utc).date()
+            return datetime.fromisoformat(str(value).replace("Z", "+00:00")).date()
+        except (ValueError, OverflowError, OSError):
+            return None
+    return None
+
+
+def aggregate(day, raw):
+    """Raw usage response for one day -> compact aggregated DataFrame."""
+    rows = []
+    for rec in _records(raw):
+        model = rec.get("model") or rec.get("model_id") or "unknown"
+        tokens = _number(rec["total_tokens"]) if "total_tokens" in rec else sum(
+            _number(rec.get(f)) for f in TOKEN_FIELDS
+        )
+        rows.append({
+            "day": day.isoformat(),
+            "provider": model.split("/")[0] if "/" in model else "unknown",
+            "model": model,
+            "endpoint": rec.get("endpoint") or rec.get("type") or rec.get("operation") or "unknown",
+            "requests": _number(rec.get("requests", rec.get("count", rec.get("num_requests", 1)))),
+            "tokens": tokens,
+            "cost": _number(rec.get("cost", rec.get("total_cost", rec.get("amount")))),
+        })
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df = df.groupby(["day", "provider", "model", "endpoint"], as_index=False)[["requests", "tokens", "cost"]].sum()
+    for col in ("day", "provider", "model", "endpoint"):
+        df[col] = df[col].astype("category")
+    return df
+
+
+def _day_end(day):
+    """Epoch seconds of the (UTC) midnight that ends `day`."""
+    return datetime.combine(day + timedelta(days=1), dt_time(), tzinfo=timezone.utc).timestamp()
+
+
+def _is_fresh(day, now=None):
+    # The Parquet file's mtime is when the day was last fetched
+    try:
+        fetched = os.path.getmtime(_paths(day)[1])
+    except OSError:
+        return False
+    if fetched >= _day_end(day) + SETTLE_SECONDS:
+        return True  # Fetched once the day was final: it can't change any more
+    return (time.time() if now is None else now) - fetched < TODAY_TTL
+
+
+def _store(day, raw):
+    raw_path, agg_path = _paths(day)
+    os.makedirs(USAGE_DIR, exist_ok=True)
+    with open(raw_path, "w", encoding="utf-8") as f:
+        json.dump(raw, f)
+    aggregate(day, raw).to_parquet(f"{agg_path}.tmp", index=False)
+    os.replace(f"{agg_path}.tmp", agg_path)
+
+
+# Parsed day tables, keyed by path and invalidated by mtime
+_frames = {}
+
+
+def _read_day(day):
+    path = _paths(day)[1]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    hit = _frames.get(path)
+    if hit is None or hit[0] != mtime:
+        hit = _frames[path] = (mtime, pd.read_parquet(path))
+    return hit[1]
+
+
+def _runs(days):
+    """Split sorted days into contiguous runs of at most MAX_RANGE_DAYS."""
+    runs = []
+    for day in days:
+        if runs and day - runs[-1][-1] == timedelta(days=1) and len(runs[-1]) < MAX_RANGE_DAYS:
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
+
+
+def _split_by_day(run, raw):
+    """{day: raw records} for a range response, or None if records aren't dated."""
+    if len(run) == 1:
+        return {run[0]: raw}
+    by_day = {day: [] for day in run}
+    for rec in _records(raw):
+        day = _record_day(rec)
+        if day is None:
+            return None
+        if day in by_day:
+            by_day[day].append(rec)
+    return {day: {"data": recs} for day, recs in by_day.items()}
+
+
+def load_usage(start, end, fetch):
+    """Aggregated usage for `start`..`end` (inclusive), fetching only stale days.
+
+    `fetch(start_str, end_str)` is the API helper (e.g. img1.get_usage). It
+    runs on worker threads, so it should raise (or return None) on failure
+    rather than draw anything. Returns `(dataframe, fetched, failed, errors)`
+    where the middle two are lists of days and `errors` lists the distinct
+    failure messages for the caller to show.
+    """
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    stale = [d for d in days if not _is_fresh(d)]
+    errors = []
+
+    def call(first, last):
+        try:
+            raw = fetch(first.isoformat(), last.isoformat())
+        except Exception as e:
+            errors.append(str(e))
+            return None
+        if raw is None:
+            errors.append(f"No usage data returned for {first.isoformat()}..{last.isoformat()}")
+        return raw
+
+    def refresh(run):
+        raw = call(run[0], run[-1])
+        by_day = None if raw is None else _split_by_day(run, raw)
+        if by_day is None and raw is not None:
+            # Undated records can't be split: ask for each day on its own
+            by_day = {}
+            for day in run:
+                day_raw = call(day, day)
+                if day_raw is not None:
+                    by_day[day] = day_raw
+        results = []
+        for day in run:
+            if by_day and day in by_day:
+                _store(day, by_day[day])
+                results.append((day, True))
+            else:
+                results.append((day, False))
+        return results
+
+    fetched, failed = [], []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for results in pool.map(refresh, _runs(stale)):
+            for day, ok in results:
+                (fetched if ok else failed).append(day)
+    errors = list(dict.fromkeys(errors))
+
+    frames = [f for f in (_read_day(d) for d in days) if f is not None and not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS), fetched, failed, errors
+    df = pd.concat(frames, ignore_index=True)
+    for col in ("day", "provider", "model", "endpoint"):
+        df[col] = df[col].astype("category")
+    return df, fetched, failed, errors
+
+
+def raw_usage(start, end):
+    """Cached raw responses for the range, keyed by ISO day."""
+    out = {}
+    for i in range((end - start).days + 1):
+        day = start + timedelta(days=i)
+        try:
+            with open(_paths(day)[0], encoding="utf-8") as f:
+                out[day.isoformat()] = json.load(f)
+        except (OSError, ValueError):
+            pass
+    return out
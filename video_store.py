@@ -0,0 +1,237 @@
+"""Local store for generated videos.
+
+Videos are streamed to disk in chunks. An interrupted download resumes from
+the partial `.part` file with an HTTP Range request guarded by If-Range (the
+ETag or Last-Modified saved with the partial file), so a changed remote file
+restarts the download instead of being spliced on; the finished file is
+verified (length, plus Content-MD5 when the server sends it) before it is
+published. The SHA-256 is kept in a sidecar `.json` and checked again before
+a stored file is first served by a process. Every session then plays
+the same local file, and the least recently used videos are evicted once the
+store grows past A4F_VIDEO_STORE_MB.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from shared_state import DATA_DIR, get_state
+from singleflight import GROUP
+
+VIDEO_DIR = os.path.join(DATA_DIR, "videos")
+MAX_STORE_BYTES = int(os.getenv("A4F_VIDEO_STORE_MB", 2048)) * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+MAX_ATTEMPTS = 5
+
+
+def video_path(url):
+    ext = os.path.splitext(urlparse(url).path)[1] or ".mp4"
+    return os.path.join(VIDEO_DIR, hashlib.sha256(url.encode()).hexdigest()[:32] + ext)
+
+
+def _meta_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _file_digest(path, algorithm):
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h
+
+
+def _total_size(response, offset):
+    # "Content-Range: bytes 1000-4999/5000" on 206, plain Content-Length on 200
+    match = re.search(r"/(\d+)$", response.headers.get("Content-Range", ""))
+    if match:
+        return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    return int(length) + offset if length else None
+
+
+def _validator(response):
+    """If-Range value identifying this version of the remote file, or None."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):  # Weak ETags aren't allowed in If-Range
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _resume_headers(part):
+    """Range/If-Range headers for continuing `part`, or {} to start over."""
+    if not os.path.exists(part):
+        return {}
+    try:
+        with open(part + ".json", encoding="utf-8") as f:
+            validator = json.load(f)["if_range"]
+    except (OSError, ValueError, KeyError):
+        validator = None
+    if not validator:
+        # No way to tell whether the remote file changed since: start over
+        os.remove(part)
+        return {}
+    return {"Range": f"bytes={os.path.getsize(part)}-", "If-Range": validator}
+
+
+def _download(url, path, meta=None):
+    part = path + ".part"
+    total, content_md5 = None, None
+    for attempt in range(MAX_ATTEMPTS):
+        headers = _resume_headers(part)
+        offset = os.path.getsize(part) if headers else 0
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=60) as r:
+                if r.status_code == 416:
+                    # Our partial file doesn't fit the remote one any more: start over
+                    _discard_part(part)
+                    continue
+                r.raise_for_status()
+                if r.status_code == 200:
+                    # Full body: a first request, a changed file (If-Range
+                    # failed) or a server that ignores Range
+                    offset = 0
+                    content_md5 = r.headers.get("Content-MD5")
+                    with open(part + ".json", "w", encoding="utf-8") as f:
+                        json.dump({"if_range": _validator(r)}, f)
+                total = _total_size(r, offset)
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            time.sleep(2 ** attempt)
+            continue
+        if total is None or os.path.getsize(part) >= total:
+            break
+    else:
+        raise RuntimeError(f"Video download did not complete after {MAX_ATTEMPTS} attempts.")
+
+    size = os.path.getsize(part)
+    if total is not None and size != total:
+        _discard_part(part)
+        raise RuntimeError(f"Video download is {size} bytes, expected {total}.")
+    if content_md5 and base64.b64encode(_file_digest(part, "md5").digest()).decode() != content_md5:
+        _discard_part(part)
+        raise RuntimeError("Video checksum does not match the server's Content-MD5.")
+
+    with open(_meta_path(path), "w", encoding="utf-8") as f:
+        json.dump({
+            **(meta or {}), "url": url, "size": size, "stored": time.time(),
+            "sha256": _file_digest(part, "sha256").hexdigest(),
+        }, f)
+    os.replace(part, path)
+    _discard_part(part)
+
+
+def _discard_part(part):
+    for p in (part, part + ".json"):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def _is_complete(path):
+    try:
+        with open(_meta_path(path), encoding="utf-8") as f:
+            return json.load(f)["size"] == os.path.getsize(path)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def verify(path):
+    """Re-hash a stored video and compare it with its recorded SHA-256."""
+    with open(_meta_path(path), encoding="utf-8") as f:
+        return _file_digest(path, "sha256").hexdigest() == json.load(f)["sha256"]
+
+
+# Files this process has already hashed, by (path, inode, size), so each
+# video is re-hashed once per process rather than on every play
+_verified = set()
+
+
+def _is_valid(path):
+    if not _is_complete(path):
+        return False
+    stat = os.stat(path)
+    key = (path, stat.st_ino, stat.st_size)
+    if key in _verified:
+        return True
+    if not verify(path):
+        return False
+    _verified.add(key)
+    return True
+
+
+def _discard(path):
+    for p in (path, _meta_path(path)):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def fetch_video(url, meta=None):
+    """Return the local path of the video at `url`, downloading it if needed.
+
+    `meta` (e.g. prompt and model) is stored in the sidecar for
+    stored_videos(). Concurrent sessions asking for the same URL share one
+    download, and the shared-state lock keeps other replicas from writing the
+    same `.part` file.
+    """
+    path = video_path(url)
+
+    def fetch():
+        # A replica that waited here finds the file already complete
+        with get_state().lock(f"video:{url}", ttl=3600):
+            if not _is_valid(path):
+                # Missing, truncated or corrupted on disk: fetch it again
+                _discard(path)
+                os.makedirs(VIDEO_DIR, exist_ok=True)
+                _download(url, path, meta)
+                evict(keep=path)
+        return path
+
+    GROUP.do(("video", url), fetch, ttl=0)
+    os.utime(path)  # mtime doubles as "last played" for LRU eviction
+    return path
+
+
+def stored_videos(limit=20):
+    """Sidecar metadata (plus "path") of stored videos, most recently used first.
+
+    The store is shared by every session and replica, so this is the list any
+    session can play back or download.
+    """
+    if not os.path.isdir(VIDEO_DIR):
+        return []
+    videos = []
+    for name in os.listdir(VIDEO_DIR):
+        path = os.path.join(VIDEO_DIR, name)
+        if name.endswith((".json", ".part")) or not _is_complete(path):
+            continue
+        try:
+            with open(_meta_path(path), encoding="utf-8") as f:
+                videos.append({**json.load(f), "path": path, "used": os.path.getmtime(path)})
+        except (OSError, ValueError):
+            continue
+    videos.sort(key=lambda v: v["used"], reverse=True)
+    return videos[:limit]
+
+
+def evict(max_bytes=MAX_STORE_BYTES, keep=None):
+    """Delete least recently used videos until the store fits in `max_bytes`."""
+    videos = [
+        os.path.join(VIDEO_DIR, name) for name in os.listdir(VIDEO_DIR)
+        if not name.endswith((".json", ".part"))
+    ]
+    videos.sort(key=os.path.getmtime)
+    used = sum(os.path.getsize(p) for p in videos)
+    for path in videos:
+        if used <= max_bytes:
+            break
+        if path == keep:
+            continue
+        used -= os.path.getsize(path)
+        _discard(path)